@@ -0,0 +1,148 @@
+"""
+Primary / read-replica database routing.
+
+Reads go to the optional ``replica`` database so balance polling, history and
+admin listings don't compete with wallet-debiting writes on the primary.
+The following always stay on ``default`` (the primary):
+
+* every write,
+* ``select_for_update()`` querysets (Django routes them as writes),
+* any read made while a ``transaction.atomic()`` block is open,
+* any read made after the current request/thread has written something
+  (see ``ReplicaPinningMiddleware`` for the cross-request "sticky" window),
+* reads by a user who wrote within REPLICA_PIN_SECONDS (``PinnedReadsMixin``).
+"""
+import contextvars
+import hashlib
+import struct
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .shm import SharedRegion
+
+PRIMARY = DEFAULT_DB_ALIAS
+REPLICA = 'replica'
+
+# True once the current request (or thread, outside a request) has written to
+# the primary. Reset per request by ReplicaPinningMiddleware.
+_pinned_to_primary = contextvars.ContextVar('pinned_to_primary', default=False)
+
+
+def pin_to_primary(pinned=True):
+    """
+    Force (or stop forcing) following reads in this context to the primary.
+    Returns a token for ``reset_pinning``.
+    """
+    return _pinned_to_primary.set(pinned)
+
+
+def reset_pinning(token):
+    _pinned_to_primary.reset(token)
+
+
+def is_pinned_to_primary():
+    return _pinned_to_primary.get()
+
+
+def replica_configured():
+    return REPLICA in connections.settings
+
+
+class SharedPins:
+    """
+    Pin expiry times in shared memory (core/shm.py), one slot per hash of
+    the key. Keys that land in the same slot share a pin: a collision can
+    only keep a user on the primary a little longer, never drop a live pin,
+    and nothing is ever evicted however many users write at once.
+    """
+    SLOT = struct.Struct('=d')  # pinned until (CLOCK_MONOTONIC, system-wide)
+
+    def __init__(self, name, slots=65536):
+        self.slots = slots
+        self.region = SharedRegion(name, self.SLOT.size * slots)
+
+    def _offset(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        return (digest % self.slots) * self.SLOT.size
+
+    def pin(self, key, seconds):
+        offset = self._offset(key)
+        until = time.monotonic() + seconds
+        with self.region.locked() as buf:
+            if self.SLOT.unpack_from(buf, offset)[0] < until:
+                self.SLOT.pack_into(buf, offset, until)
+
+    def is_pinned(self, key):
+        offset = self._offset(key)
+        with self.region.locked() as buf:
+            until, = self.SLOT.unpack_from(buf, offset)
+        return until > time.monotonic()
+
+
+shared_pins = SharedPins('replica-pins')
+
+
+def _user_pin_key(user):
+    return f"db-primary-pin:{user.pk}"
+
+
+def pin_user(user):
+    """
+    Keep ``user``'s reads on the primary for REPLICA_PIN_SECONDS. Stored
+    where all workers see it (shared memory, or the REPLICA_PIN_CACHE cache
+    across hosts), so it works for clients that drop cookies.
+    """
+    if settings.REPLICA_PIN_CACHE:
+        caches[settings.REPLICA_PIN_CACHE].set(_user_pin_key(user), 1, settings.REPLICA_PIN_SECONDS)
+    else:
+        shared_pins.pin(_user_pin_key(user), settings.REPLICA_PIN_SECONDS)
+
+
+def user_is_pinned(user):
+    if settings.REPLICA_PIN_CACHE:
+        return caches[settings.REPLICA_PIN_CACHE].get(_user_pin_key(user)) is not None
+    return shared_pins.is_pinned(_user_pin_key(user))
+
+
+class PinnedReadsMixin:
+    """
+    For DRF views that read data a user may just have changed (balance,
+    history). The user is only known after DRF authenticates, in initial().
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if replica_configured() and request.user.is_authenticated and user_is_pinned(request.user):
+            # Undone with the rest of the request's pinning by the middleware.
+            pin_to_primary()
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads to the replica unless doing so could return stale data.
+    Without a ``replica`` entry in DATABASES this router is a no-op.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not replica_configured() or _pinned_to_primary.get():
+            return PRIMARY
+        # Inside transaction.atomic() we must read what we are about to write.
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        # Read-your-writes: once we've written, stop trusting the replica.
+        _pinned_to_primary.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data, so relations are always fine.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication, never migrate it.
+        return db == PRIMARY
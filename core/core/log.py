@@ -0,0 +1,171 @@
+"""
+Structured, non-blocking logging.
+
+Request threads format each record as one JSON object per line and put it
+on an in-memory queue. A background thread writes the lines to stdout, so
+slow stdout writes never show up in request latency.
+
+Every record carries the correlation IDs bound for the current request
+(``request_id``, ``transaction_id``, ``vendor_request_id``), so a request,
+its Transaction row and the vendor's RequestID can be joined in the logs.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+CORRELATION_FIELDS = ('request_id', 'transaction_id', 'vendor_request_id')
+
+_correlation = {
+    name: contextvars.ContextVar(name, default=None) for name in CORRELATION_FIELDS
+}
+
+
+def bind(**ids):
+    """Attach correlation IDs to every log record in the current context."""
+    for name, value in ids.items():
+        _correlation[name].set(str(value) if value is not None else None)
+
+
+def clear():
+    for var in _correlation.values():
+        var.set(None)
+
+
+def current(name):
+    return _correlation[name].get()
+
+
+def vendor_payload(text):
+    """
+    Decide how much of a vendor payload to log.
+
+    Returns None when this payload isn't sampled (LOG_VENDOR_PAYLOAD_SAMPLE_RATE),
+    otherwise the text cut to LOG_VENDOR_PAYLOAD_MAX_CHARS.
+    """
+    rate = settings.LOG_VENDOR_PAYLOAD_SAMPLE_RATE
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return None
+    limit = settings.LOG_VENDOR_PAYLOAD_MAX_CHARS
+    if text and len(text) > limit:
+        return f"{text[:limit]}...[{len(text) - limit} chars truncated]"
+    return text
+
+
+class CorrelationFilter(logging.Filter):
+    """
+    Copies the bound correlation IDs onto the record. Runs on the request
+    thread (handler filters do), before the record is queued.
+    """
+
+    def filter(self, record):
+        for name, var in _correlation.items():
+            if not hasattr(record, name):
+                setattr(record, name, var.get())
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name in CORRELATION_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    The stdlib QueueHandler / QueueListener pair: request threads put
+    records on a queue and a listener thread writes them to stdout.
+
+    QueueHandler.prepare() formats the record (message arguments included)
+    on the thread that logged it, so e.g. a model instance's __str__ never
+    runs queries from the listener thread. Only the stdout write is moved
+    off the request thread. If the queue is full, records below ERROR are
+    dropped rather than blocking the request (the count is logged later);
+    ERROR and above wait for room and are never dropped.
+
+    The listener is started lazily in each process, because threads don't
+    survive gunicorn's fork of a preloaded master. Configure this handler
+    with '()' in LOGGING, not 'class': for QueueHandler classes Python
+    3.12+'s dictConfig builds a listener of its own.
+    """
+
+    def __init__(self, maxsize=10000, stream='ext://sys.stdout'):
+        super().__init__(None)
+        self.maxsize = maxsize
+        self.target = logging.StreamHandler(sys.stderr if stream == 'ext://sys.stderr' else sys.stdout)
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._dropped = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A fresh queue per process: one inherited across fork may have
+            # its internal lock held by a thread that no longer exists.
+            self.queue = queue.Queue(self.maxsize)
+            self._dropped = 0
+            self.listener = logging.handlers.QueueListener(self.queue, self.target)
+            self.listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.flush_and_stop)
+
+    def emit(self, record):
+        self._ensure_started()
+        super().emit(record)
+
+    def enqueue(self, record):
+        if self._dropped:
+            self._report_dropped()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.ERROR:
+                self.queue.put(record)
+            else:
+                self._dropped += 1
+
+    def _report_dropped(self):
+        dropped = self._dropped
+        notice = self.prepare(logging.makeLogRecord({
+            'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+            'msg': "Log queue full, dropped %d records", 'args': (dropped,),
+        }))
+        try:
+            self.queue.put_nowait(notice)
+        except queue.Full:
+            return
+        self._dropped -= dropped
+
+    def flush_and_stop(self):
+        if self._pid != os.getpid() or self.listener is None:
+            return
+        listener, self.listener = self.listener, None
+        try:
+            listener.stop()
+        except queue.Full:
+            pass
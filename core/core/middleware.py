@@ -0,0 +1,118 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from . import log, traffic
+from .db_router import is_pinned_to_primary, pin_to_primary, pin_user, replica_configured, reset_pinning
+
+# Cookie that marks a client which wrote recently. While it is present (it
+# expires after REPLICA_PIN_SECONDS) that client's reads stay on the primary.
+# Clients without cookies (API scripts) are covered by the per-user pin.
+PIN_COOKIE = 'db_primary_pin'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaPinningMiddleware:
+    """
+    Keeps a user's reads on the primary for a short window after they write,
+    so a purchase is never followed by a stale balance from the replica.
+
+    * Unsafe methods (POST, PUT, ...) are pinned for the whole request.
+    * A request that writes gets a short-lived cookie; follow-up requests
+      carrying it are pinned too.
+    * A request that writes also pins its user (db_router.pin_user), which
+      views with PinnedReadsMixin check once DRF has authenticated them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        # Worker threads are reused, so pin state is set up and torn down
+        # around every request.
+        pinned_up_front = self._should_pin(request)
+        token = pin_to_primary(pinned_up_front)
+        try:
+            response = self.get_response(request)
+            wrote = request.method not in SAFE_METHODS or (
+                is_pinned_to_primary() and not pinned_up_front
+            )
+            if wrote:
+                response.set_cookie(
+                    PIN_COOKIE, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+                # DRF copies the authenticated user onto the Django request.
+                user = getattr(request, 'user', None)
+                if user is not None and user.is_authenticated:
+                    pin_user(user)
+            return response
+        finally:
+            reset_pinning(token)
+
+    def _should_pin(self, request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+
+class RequestIDMiddleware:
+    """
+    Gives every request a correlation ID for the structured logs (see
+    core/log.py). An incoming X-Request-ID header is reused so IDs from a
+    load balancer or client carry through; the ID is echoed back on the
+    response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        log.clear()
+        log.bind(request_id=request_id[:64])
+        try:
+            response = self.get_response(request)
+            response['X-Request-ID'] = log.current('request_id')
+            return response
+        finally:
+            log.clear()
+
+
+class TrafficCaptureMiddleware:
+    """
+    Records sanitized buy-airtime and funding-webhook traffic for replay
+    when TRAFFIC_CAPTURE_PATH is set (see core/traffic.py). Does nothing
+    otherwise.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not traffic.capture_enabled():
+            return self.get_response(request)
+
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            url_name = None
+        # Reads the body now, before the view consumes the stream.
+        exchange = traffic.start_exchange(request, url_name) if url_name in traffic.CAPTURED_VIEWS else None
+        if exchange is None:
+            return self.get_response(request)
+
+        started = time.monotonic()
+        try:
+            response = self.get_response(request)
+        except Exception:
+            traffic.stop_capture()
+            raise
+        traffic.finish_exchange(exchange, request, response, time.monotonic() - started)
+        return response
@@ -1,6 +1,7 @@
 from pathlib import Path
 import os
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -14,8 +15,15 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('SECRET_KEY')
 
+# --- RUNTIME PROFILE ---
+# 'development' (default) or 'production'. Production turns DEBUG off (with
+# DEBUG on Django keeps every SQL query in memory) and enables DB connection
+# pooling. The gunicorn side of the profile lives in gunicorn.conf.py.
+RUNTIME_PROFILE = os.getenv('RUNTIME_PROFILE', 'development')
+PRODUCTION = RUNTIME_PROFILE == 'production'
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
 
 # --- SECURITY CONFIGURATION ---
 ALLOWED_HOSTS = ['*']
@@ -55,7 +63,10 @@ timedelta(days=7),
 }
 
 MIDDLEWARE = [
+    'core.middleware.RequestIDMiddleware',
+    'core.middleware.TrafficCaptureMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,13 +103,47 @@ WSGI_APPLICATION = 'core.wsgi.application'
 
 
 # --- DATABASE CONFIGURATION ---
+# How PostgreSQL connections are managed:
+#   'persistent' - one long-lived connection per worker thread (old behaviour)
+#   'pool'       - psycopg 3 connection pool inside each gunicorn worker
+#   'pgbouncer'  - talk to a pgbouncer in transaction mode (no server-side
+#                  cursors, no prepared statements)
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'pool' if PRODUCTION else 'persistent')
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))
+# One connection per gunicorn thread is enough, a little headroom for admin.
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', int(os.getenv('GUNICORN_THREADS', 4)) + 2))
+
+
+def postgres_database(url):
+    """Build a DATABASES entry for ``url`` according to DB_POOL_MODE."""
+    if DB_POOL_MODE == 'pool':
+        # Django's pool needs CONN_MAX_AGE = 0. CONN_HEALTH_CHECKS makes it
+        # pass ConnectionPool.check_connection, so the pool checks each
+        # connection before handing it out.
+        db = dj_database_url.parse(url, conn_max_age=0, conn_health_checks=True)
+        db.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': 10,
+        }
+    elif DB_POOL_MODE == 'pgbouncer':
+        db = dj_database_url.parse(url, conn_max_age=600, conn_health_checks=True)
+        db['DISABLE_SERVER_SIDE_CURSORS'] = True
+        db.setdefault('OPTIONS', {})['prepare_threshold'] = None
+    elif DB_POOL_MODE == 'persistent':
+        db = dj_database_url.parse(url, conn_max_age=600, conn_health_checks=True)
+    else:
+        raise ImproperlyConfigured(
+            f"DB_POOL_MODE must be 'persistent', 'pool' or 'pgbouncer', not {DB_POOL_MODE!r}."
+        )
+    return db
+
 
-# --- DATABASE CONFIGURATION ---
 # Check if the DATABASE_URL environment variable exists (it will on Render)
 if os.getenv("DATABASE_URL"):
     # We are in production on Render, use PostgreSQL
     DATABASES = {
-        'default': dj_database_url.config(default=os.getenv("DATABASE_URL"), conn_max_age=600)
+        'default': postgres_database(os.getenv("DATABASE_URL"))
     }
 else:
     # We are developing locally, use SQLite
@@ -108,6 +153,38 @@ else:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+
+# --- READ REPLICA (optional) ---
+# If DATABASE_REPLICA_URL is set, read-only queries (balance, history, admin
+# listings) go to the replica. Writes, select_for_update() and anything inside
+# transaction.atomic() stay on 'default'. See core/db_router.py.
+if os.getenv("DATABASE_REPLICA_URL"):
+    DATABASES['replica'] = postgres_database(os.getenv("DATABASE_REPLICA_URL"))
+    # Tests run against the primary only.
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+
+# How long (seconds) a client's reads stay on the primary after it writes,
+# so a purchase is never followed by a stale balance from a lagging replica.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+# Where per-user pins are kept. It must be shared by every web worker. By
+# default pins live in shared memory (core/shm.py, ADMISSION_SHM_DIR), which
+# covers all workers on one host. With several web hosts, set
+# REPLICA_PIN_CACHE_BACKEND / REPLICA_PIN_CACHE_LOCATION to a shared Redis
+# cache. Not the file cache: past MAX_ENTRIES it deletes random live pins.
+REPLICA_PIN_CACHE = None
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+if os.getenv('REPLICA_PIN_CACHE_BACKEND'):
+    REPLICA_PIN_CACHE = 'replica_pins'
+    CACHES[REPLICA_PIN_CACHE] = {
+        'BACKEND': os.getenv('REPLICA_PIN_CACHE_BACKEND'),
+        'LOCATION': os.getenv('REPLICA_PIN_CACHE_LOCATION'),
+    }
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -165,4 +242,82 @@ REST_FRAMEWORK = {
 # --- Custom App Settings ---
 VTU_API_USERID = os.getenv('VTU_API_USERID')
 VTU_API_KEY = os.getenv('VTU_API_KEY')
-VTU_BASE_URL = os.getenv('VTU_BASE_URL')
\ No newline at end of file
+VTU_BASE_URL = os.getenv('VTU_BASE_URL')
+# Vendor client class. Replay runs swap in transactions.services.ReplayVendor.
+VTU_VENDOR = os.getenv('VTU_VENDOR', 'transactions.services.RealVTUVendor')
+
+# --- Traffic capture ---
+# When set, sanitized buy-airtime and webhook requests (with the vendor
+# replies they caused) are appended to this JSONL file, for replay with
+# `manage.py replay_traffic`. See core/traffic.py.
+TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH')
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.getenv('TRAFFIC_CAPTURE_SAMPLE_RATE', 1))
+
+# --- Admission control (buy-airtime) ---
+# Token buckets: sustained requests/second and burst size, per user and per
+# network, shared by all workers on a host (transactions/throttling.py).
+PURCHASE_USER_RATE = float(os.getenv('PURCHASE_USER_RATE', 5))
+PURCHASE_USER_BURST = float(os.getenv('PURCHASE_USER_BURST', 20))
+PURCHASE_NETWORK_RATE = float(os.getenv('PURCHASE_NETWORK_RATE', 50))
+PURCHASE_NETWORK_BURST = float(os.getenv('PURCHASE_NETWORK_BURST', 100))
+# Purchases allowed at the vendor at once (per host); beyond it we answer 503.
+VENDOR_MAX_IN_FLIGHT = int(os.getenv('VENDOR_MAX_IN_FLIGHT', 32))
+# Where the shared counters (and replica pins) live; defaults to /dev/shm.
+ADMISSION_SHM_DIR = os.getenv('ADMISSION_SHM_DIR')
+
+# --- Vendor float monitor (transactions/vendor_float.py) ---
+# How often (per host) to poll our prepaid balance with the vendor, and how
+# old the cached figure may get before we stop trusting it.
+VENDOR_FLOAT_POLL_SECONDS = int(os.getenv('VENDOR_FLOAT_POLL_SECONDS', 60))
+VENDOR_FLOAT_MAX_AGE_SECONDS = int(os.getenv('VENDOR_FLOAT_MAX_AGE_SECONDS', 600))
+# Log a critical alert when the float drops below each of these (naira).
+VENDOR_FLOAT_ALERT_THRESHOLDS = [
+    int(t) for t in os.getenv('VENDOR_FLOAT_ALERT_THRESHOLDS', '50000,10000').split(',') if t
+]
+
+# --- LOGGING ---
+# JSON lines on stdout, written by a background thread (core/log.py) so the
+# request thread never blocks on stdout. Records carry request_id,
+# transaction_id and vendor_request_id for correlation.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'correlation': {'()': 'core.log.CorrelationFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'core.log.JsonFormatter'},
+    },
+    'handlers': {
+        'queue': {
+            # '()' rather than 'class': see BackgroundQueueHandler.
+            '()': 'core.log.BackgroundQueueHandler',
+            'formatter': 'json',
+            'filters': ['correlation'],
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': os.getenv('LOG_LEVEL', 'INFO'),
+    },
+    'loggers': {
+        # Replace Django's own console handler so nothing is logged twice.
+        'django': {
+            'handlers': ['queue'],
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Vendor payloads are big and mostly repetitive. Log this fraction of them
+# (0 = never, 1 = always), cut to at most this many characters.
+LOG_VENDOR_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_VENDOR_PAYLOAD_SAMPLE_RATE', 1 if DEBUG else 0.05))
+LOG_VENDOR_PAYLOAD_MAX_CHARS = int(os.getenv('LOG_VENDOR_PAYLOAD_MAX_CHARS', 512))
+
+# --- Payment Gateway ---
+# Used to double-check funding attempts the webhook never told us about.
+# Set PAYMENT_GATEWAY=payments.gateway.LocalGateway to develop offline.
+PAYMENT_GATEWAY = os.getenv('PAYMENT_GATEWAY', 'payments.gateway.PaystackGateway')
+PAYSTACK_SECRET_KEY = os.getenv('PAYSTACK_SECRET_KEY')
+PAYSTACK_BASE_URL = os.getenv('PAYSTACK_BASE_URL', 'https://api.paystack.co')
@@ -0,0 +1,66 @@
+"""
+Small memory-mapped files shared by every gunicorn worker on a host, for
+state that must be seen by all workers but isn't worth a network round trip
+(admission control, the vendor float, replica pins).
+
+Files live in ADMISSION_SHM_DIR, by default /dev/shm.
+"""
+import fcntl
+import mmap
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+def _shm_path(name):
+    base = settings.ADMISSION_SHM_DIR or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+    return os.path.join(base, f"vtu-admission-{name}")
+
+
+class SharedRegion:
+    """
+    A fixed-size memory-mapped file plus a lock that works across threads
+    (threading.Lock) and across processes (flock). The file is (re)opened
+    lazily per process: a descriptor inherited over fork shares its flock
+    with the parent, so it would not exclude it. It is also reopened when
+    ADMISSION_SHM_DIR changes (tests, replay_traffic).
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self._pid = None
+        self._path = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def path(self):
+        return _shm_path(self.name)
+
+    def _open(self, path):
+        if self._pid == os.getpid():
+            # Same process, new directory: don't leak the old mapping.
+            self._map.close()
+            os.close(self._fd)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < self.size:
+            os.ftruncate(fd, self.size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size)
+        self._pid = os.getpid()
+        self._path = path
+
+    @contextmanager
+    def locked(self):
+        with self._thread_lock:
+            path = self.path
+            if self._pid != os.getpid() or self._path != path:
+                self._open(path)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self._map
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
@@ -0,0 +1,171 @@
+"""
+Traffic capture and replay.
+
+Capture (TRAFFIC_CAPTURE_PATH set): TrafficCaptureMiddleware writes one JSON
+line per buy-airtime / funding-webhook request. Each line holds the
+sanitized request body, our response status and latency, and every vendor
+call the request made (status, body, latency). Several gunicorn workers can
+share one file: lines are written with a single O_APPEND write.
+
+Replay (``manage.py replay_traffic``): the recorded requests go back through
+the real URL stack and views. ReplayVendor (transactions/services.py)
+stands in for the vendor's HTTP call and answers with the recorded reply
+after the recorded latency.
+"""
+import contextvars
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+CAPTURED_VIEWS = ('buy-airtime', 'fund-webhook')
+
+# Keys removed outright / replaced with a stable fake value when captured.
+DROP_KEYS = {'pin', 'password', 'authorization', 'customer', 'apikey', 'userid', 'email'}
+MASK_KEYS = {'phone_number', 'phone', 'mobileno', 'mobilenumber', 'mobile_number'}
+
+# The exchange being recorded (capture) or replayed (replay) in this context.
+_capturing = contextvars.ContextVar('traffic_capturing', default=None)
+_replaying = contextvars.ContextVar('traffic_replaying', default=None)
+
+_write_lock = threading.Lock()
+
+
+def _mask(value):
+    """Same input -> same fake number, same length, so replays stay realistic."""
+    text = str(value)
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    fake = ''.join(str(int(c, 16) % 10) for c in digest)
+    return text[:4] + fake[:max(len(text) - 4, 0)]
+
+
+def sanitize(data):
+    if isinstance(data, dict):
+        clean = {}
+        for key, value in data.items():
+            lowered = str(key).lower()
+            if lowered in DROP_KEYS:
+                continue
+            clean[key] = _mask(value) if lowered in MASK_KEYS else sanitize(value)
+        return clean
+    if isinstance(data, list):
+        return [sanitize(item) for item in data]
+    return data
+
+
+def _parse(body):
+    try:
+        return json.loads(body) if body else {}
+    except ValueError:
+        return {'_unparsed': body[:200] if isinstance(body, str) else None}
+
+
+# --- Capture ---------------------------------------------------------------
+
+def capture_enabled():
+    return bool(settings.TRAFFIC_CAPTURE_PATH)
+
+
+def start_exchange(request, url_name):
+    """Begin recording a request, if capture is on and it is sampled."""
+    if random.random() >= settings.TRAFFIC_CAPTURE_SAMPLE_RATE:
+        return None
+    body = request.body.decode('utf-8', errors='replace')
+    exchange = {
+        'time': time.time(),
+        'view': url_name,
+        'method': request.method,
+        'path': request.path,
+        'content_type': request.content_type,
+        'body': sanitize(_parse(body)),
+        'vendor': [],
+    }
+    _capturing.set(exchange)
+    return exchange
+
+
+def record_vendor_call(status_code, text, latency):
+    """
+    Called by the vendor client after every real HTTP call. ``status_code``
+    is None when the call itself failed (timeout, connection error).
+    """
+    exchange = _capturing.get()
+    if exchange is not None:
+        exchange['vendor'].append({
+            'status_code': status_code,
+            'body': sanitize(_parse(text)),
+            'latency_ms': round(latency * 1000, 1),
+        })
+
+
+def stop_capture():
+    _capturing.set(None)
+
+
+def finish_exchange(exchange, request, response, latency):
+    stop_capture()
+    user = getattr(request, 'user', None)
+    exchange.update({
+        'user': user.pk if user is not None and user.is_authenticated else None,
+        'status': response.status_code,
+        'latency_ms': round(latency * 1000, 1),
+    })
+    line = (json.dumps(exchange, default=str) + '\n').encode()
+    with _write_lock:
+        fd = os.open(settings.TRAFFIC_CAPTURE_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def read_capture(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --- Replay ----------------------------------------------------------------
+
+def replay_vendor_calls(calls, latency_scale=1.0):
+    """Make the recorded vendor replies available to ReplayVendor in this context."""
+    return _replaying.set({'calls': list(calls), 'latency_scale': latency_scale})
+
+
+def stop_replay(token):
+    _replaying.reset(token)
+
+
+class ReplayResponse:
+    """The parts of requests.Response the vendor client uses."""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = json.dumps(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} (replayed)")
+
+
+def next_replayed_call():
+    """
+    Used by ReplayVendor: wait out the recorded vendor latency, then return
+    the recorded reply (or None if nothing was recorded).
+    """
+    state = _replaying.get()
+    if not state or not state['calls']:
+        return None
+    call = state['calls'].pop(0)
+    time.sleep(call['latency_ms'] / 1000 * state['latency_scale'])
+    if call['status_code'] is None:
+        raise requests.exceptions.ConnectionError("Recorded vendor call failed (replayed)")
+    return ReplayResponse(call['status_code'], call['body'])
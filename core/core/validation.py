@@ -0,0 +1,199 @@
+"""
+Fast request validation for the hottest endpoints (buy-airtime, funding).
+
+A DRF serializer is expensive to run per request: every instance deep-copies
+its declared fields before validating anything. compile_serializer() reads a
+plain Serializer's fields once, at import time, and returns a function that
+checks a JSON dict directly. Accepted values, validated data and error
+messages (and their codes) match serializer.is_valid() / .errors, so
+responses don't change. Anything it doesn't cover (non-dict input such as
+form posts) is passed to the real serializer.
+
+json_body() decodes a JSON request body straight from the raw bytes with the
+C json decoder, skipping DRF's parser negotiation and stream wrappers.
+"""
+import decimal
+import json
+
+from django.http.request import RawPostDataException
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.fields import empty
+from rest_framework.settings import api_settings
+from rest_framework.utils.json import strict_constant
+
+_MISSING = object()
+
+
+def _field_check(field):
+    """One function per field: primitive value in, validated value out (or ValidationError)."""
+    messages = field.error_messages
+
+    def fail(key, **kwargs):
+        raise serializers.ValidationError(messages[key].format(**kwargs), code=key)
+
+    if isinstance(field, serializers.ChoiceField):
+        choices = field.choice_strings_to_values
+        allow_blank = field.allow_blank
+
+        def convert(value):
+            if value == '' and allow_blank:
+                return ''
+            try:
+                return choices[str(value)]
+            except KeyError:
+                fail('invalid_choice', input=value)
+
+    elif type(field) is serializers.CharField:
+        allow_blank, trim = field.allow_blank, field.trim_whitespace
+
+        def convert(value):
+            if value == '' or (trim and str(value).strip() == ''):
+                if not allow_blank:
+                    fail('blank')
+                return ''
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                fail('invalid')
+            value = str(value)
+            return value.strip() if trim else value
+
+    elif type(field) is serializers.DecimalField and not field.localize:
+        max_digits, places, max_whole = field.max_digits, field.decimal_places, field.max_whole_digits
+        max_length = field.MAX_STRING_LENGTH
+        if places is not None:
+            quantum = decimal.Decimal('.1') ** places
+            context = decimal.getcontext().copy()
+            if max_digits is not None:
+                context.prec = max_digits
+
+        def convert(value):
+            value = str(value).strip()
+            if len(value) > max_length:
+                fail('max_string_length')
+            try:
+                value = decimal.Decimal(value)
+            except decimal.DecimalException:
+                fail('invalid')
+            if not value.is_finite():
+                fail('invalid')
+
+            # Same digit counting as DecimalField.validate_precision().
+            _, digits, exponent = value.as_tuple()
+            if exponent >= 0:
+                total = whole = len(digits) + exponent
+                decimals = 0
+            elif len(digits) > -exponent:
+                total, whole, decimals = len(digits), len(digits) + exponent, -exponent
+            else:
+                total = decimals = -exponent
+                whole = 0
+            if max_digits is not None and total > max_digits:
+                fail('max_digits', max_digits=max_digits)
+            if places is not None and decimals > places:
+                fail('max_decimal_places', max_decimal_places=places)
+            if max_whole is not None and whole > max_whole:
+                fail('max_whole_digits', max_whole_digits=max_whole)
+
+            if places is None:
+                return value
+            return value.quantize(quantum, rounding=field.rounding, context=context)
+
+    else:
+        raise TypeError(f"compile_serializer() doesn't support {type(field).__name__} ({field.field_name})")
+
+    if not field.validators:
+        return convert
+
+    def convert_and_validate(value):
+        value = convert(value)
+        # max_length, null characters etc.: DRF's own validator loop and messages.
+        field.run_validators(value)
+        return value
+
+    return convert_and_validate
+
+
+def compile_serializer(serializer_class):
+    """
+    Build ``validate(data) -> (validated_data, errors)`` for a Serializer made
+    of CharField / ChoiceField / DecimalField fields and validate_<field>
+    methods. ``errors`` is empty when the data is valid, otherwise it has
+    the same shape as ``serializer.errors``.
+    Raises TypeError for serializers that need more than that.
+    """
+    serializer = serializer_class()
+    if type(serializer).validate is not serializers.Serializer.validate or serializer.validators:
+        raise TypeError(f"{serializer_class.__name__} has object-level validation; use the serializer")
+
+    checks = []
+    for name, field in serializer.fields.items():
+        if field.read_only:
+            continue
+        if field.source != name or field.allow_null or field.default is not empty or not field.required:
+            raise TypeError(f"compile_serializer() only supports required, non-null fields ({name})")
+        checks.append((
+            name,
+            _field_check(field),
+            getattr(serializer, 'validate_' + name, None),
+            field.error_messages,
+        ))
+
+    def validate(data):
+        if type(data) is not dict:
+            fallback = serializer_class(data=data)
+            fallback.is_valid()
+            return fallback.validated_data, fallback.errors
+
+        validated = {}
+        errors = {}
+        for name, check, validate_method, messages in checks:
+            value = data.get(name, _MISSING)
+            try:
+                if value is _MISSING:
+                    raise serializers.ValidationError(messages['required'], code='required')
+                if value is None:
+                    raise serializers.ValidationError(messages['null'], code='null')
+                value = check(value)
+                if validate_method is not None:
+                    value = validate_method(value)
+            except serializers.ValidationError as exc:
+                errors[name] = exc.detail
+            else:
+                validated[name] = value
+        if errors:
+            return {}, errors
+        return validated, {}
+
+    return validate
+
+
+def json_body(request):
+    """
+    The parsed JSON body of a DRF request, decoded once from the raw bytes
+    and cached on the request. Bad JSON raises the same ParseError (400) as
+    DRF's JSONParser. Requests that aren't JSON get request.data.
+    """
+    cached = getattr(request, '_json_body', _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    if request.content_type.split(';')[0].strip().lower() != 'application/json':
+        data = request.data
+    else:
+        try:
+            body = request.body
+        except RawPostDataException:
+            # Something already read the stream through request.data.
+            body = None
+        if body is None:
+            data = request.data
+        elif not body:
+            data = {}
+        else:
+            try:
+                data = json.loads(body, parse_constant=strict_constant if api_settings.STRICT_JSON else None)
+            except ValueError as exc:
+                raise ParseError('JSON parse error - %s' % str(exc))
+
+    request._json_body = data
+    return data
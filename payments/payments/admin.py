@@ -1,9 +1,38 @@
-from django.contrib import admin
+from decimal import Decimal
 
 from django.contrib import admin
-from .models import Wallet
+from django.db.models import Sum
+from .models import Wallet, WalletShard, BonusCampaign
+
+class WalletShardInline(admin.TabularInline):
+    model = WalletShard
+    extra = 0
+    readonly_fields = ('index', 'balance')
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        # Shards are created by payments.sharding.enable_sharding only.
+        return False
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
-    list_display = ('user', 'balance', 'wallet_id', 'updated_at')
-    search_fields = ('user__username', 'wallet_id')
\ No newline at end of file
+    list_display = ('user', 'total_balance', 'shard_count', 'wallet_id', 'updated_at')
+    inlines = [WalletShardInline]
+    search_fields = ('user__username', 'wallet_id')
+
+    def get_queryset(self, request):
+        # One SUM for the whole page, not Wallet.total_balance's query per row.
+        return super().get_queryset(request).annotate(shard_total=Sum('shards__balance'))
+
+    @admin.display(description='Balance')
+    def total_balance(self, obj):
+        if not obj.is_sharded:
+            return obj.balance
+        return obj.shard_total or Decimal('0.00')
+
+@admin.register(BonusCampaign)
+class BonusCampaignAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'kind', 'value', 'status', 'wallets_credited', 'total_credited')
+    list_filter = ('status', 'kind')
+    # Progress is written by `manage.py run_bonus_campaign` only.
+    readonly_fields = ('status', 'last_user_id', 'wallets_credited', 'total_credited', 'completed_at')
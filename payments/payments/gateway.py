@@ -0,0 +1,91 @@
+import logging
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """We couldn't get an answer from the gateway; try again later."""
+
+
+class PaystackGateway:
+    """
+    Asks Paystack what actually happened to a payment.
+    Docs: https://paystack.com/docs/api/transaction/#verify
+    """
+
+    def __init__(self):
+        self.secret_key = settings.PAYSTACK_SECRET_KEY
+        self.base_url = settings.PAYSTACK_BASE_URL
+        if not self.secret_key:
+            logger.error("Paystack secret key not configured in settings.")
+            raise Exception("Gateway credentials missing.")
+        # One keep-alive session, shared by the sweeper's worker threads.
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {self.secret_key}"
+
+    def verify(self, reference):
+        """
+        Returns {"status": ..., "amount": Decimal naira, "raw_response": {...}}.
+        "status" is Paystack's: 'success', 'failed', 'abandoned', ... or
+        'not_found' if Paystack has never seen this reference.
+        Raises GatewayError on network problems or unexpected replies.
+        """
+        endpoint = f"{self.base_url.rstrip('/')}/transaction/verify/{reference}"
+        try:
+            response = self.session.get(endpoint, timeout=15)
+            if self._not_found(response):
+                return {"status": "not_found", "amount": Decimal('0'), "raw_response": {}}
+            response.raise_for_status()
+            data = response.json().get('data') or {}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise GatewayError(str(e)) from e
+
+        return {
+            "status": data.get('status'),
+            # Paystack amounts are in kobo
+            "amount": Decimal(data.get('amount') or 0) / 100,
+            "raw_response": data,
+        }
+
+    @staticmethod
+    def _not_found(response):
+        # Paystack answers an unknown reference with HTTP 400 and
+        # {"status": false, "message": "Transaction reference not found"}.
+        if response.status_code == 404:
+            return True
+        if response.status_code != 400:
+            return False
+        try:
+            body = response.json()
+        except ValueError:
+            return False
+        if not isinstance(body, dict) or body.get('status') is not False:
+            return False
+        return 'not found' in str(body.get('message', '')).lower() or 'not_found' in str(body.get('code', ''))
+
+
+class LocalGateway:
+    """
+    Stand-in gateway for tests and local development. ``payments`` maps a
+    reference to (status, naira amount); anything else is 'not_found'.
+    """
+
+    def __init__(self, payments=None):
+        self.payments = dict(payments or {})
+
+    def verify(self, reference):
+        status, amount = self.payments.get(reference, ('not_found', Decimal('0')))
+        return {
+            "status": status,
+            "amount": Decimal(amount),
+            "raw_response": {"reference": reference, "status": status, "local": True},
+        }
+
+
+def get_gateway():
+    return import_string(settings.PAYMENT_GATEWAY)()
@@ -0,0 +1,78 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from payments import sharding
+from payments.models import Wallet
+
+BENCH_USERNAME = '__shard_benchmark__'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure purchase throughput on ONE hot wallet for different shard "
+        "counts. Each simulated purchase debits the wallet and holds the lock "
+        "for --vendor-ms, like BuyAirtimeView does while it waits on the vendor. "
+        "Needs PostgreSQL (row locks); uses a throwaway user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', default='0,1,2,4,8,16',
+                            help="Comma separated shard counts; 0 = unsharded wallet.")
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--vendor-ms', type=float, default=20)
+
+    def handle(self, shards, threads, seconds, vendor_ms, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("This benchmark needs PostgreSQL; SQLite has no row locks.")
+
+        self.stdout.write(f"{threads} threads, {seconds}s per run, {vendor_ms}ms simulated vendor call\n")
+        self.stdout.write(f"{'shards':>8} {'purchases':>10} {'per sec':>10}")
+        for count in [int(n) for n in shards.split(',')]:
+            done = self._run(count, threads, seconds, vendor_ms / 1000)
+            label = count or 'off'
+            self.stdout.write(f"{label:>8} {done:>10} {done / seconds:>10.1f}")
+
+    def _run(self, shard_count, threads, seconds, vendor_delay):
+        User = get_user_model()
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create_user(username=BENCH_USERNAME)
+        wallet, _ = Wallet.objects.update_or_create(user=user, defaults={'balance': Decimal('100000000.00')})
+        if shard_count:
+            sharding.enable_sharding(wallet, shard_count)
+            wallet.refresh_from_db()
+
+        deadline = time.monotonic() + seconds
+        counts = []
+        amount = Decimal('1.00')
+
+        def purchase_loop():
+            done = 0
+            try:
+                while time.monotonic() < deadline:
+                    with transaction.atomic():
+                        if wallet.is_sharded:
+                            sharding.debit(wallet, amount)
+                        else:
+                            locked = Wallet.objects.select_for_update().get(pk=wallet.pk)
+                            locked.balance -= amount
+                            locked.save(update_fields=['balance'])
+                        time.sleep(vendor_delay)
+                    done += 1
+            finally:
+                counts.append(done)
+                connections.close_all()
+
+        workers = [threading.Thread(target=purchase_loop) for _ in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        user.delete()
+        return sum(counts)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.campaigns import CampaignNotFinished, run_campaign
+from payments.models import BonusCampaign
+
+
+class Command(BaseCommand):
+    help = (
+        "Credit a bonus/cashback campaign to every eligible wallet. Resumable "
+        "and idempotent: re-running only credits wallets not yet credited."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('code', help="BonusCampaign.code")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Wallets per transaction; smaller = shorter row locks.")
+        parser.add_argument('--max-chunks', type=int, help="Stop after this many chunks.")
+
+    def handle(self, code, chunk_size, max_chunks=None, **options):
+        try:
+            campaign = BonusCampaign.objects.get(code=code)
+        except BonusCampaign.DoesNotExist:
+            raise CommandError(f"Campaign {code} not found")
+
+        try:
+            stats = run_campaign(campaign, chunk_size=chunk_size, max_chunks=max_chunks)
+        except CampaignNotFinished as e:
+            raise CommandError(f"{e}; credit it once it has ended.")
+        self.stdout.write(
+            f"{campaign.code}: credited {stats['wallets']} wallets (₦{stats['credited']}) "
+            f"in {stats['seconds']}s = {stats['wallets_per_second']} wallets/s. "
+            f"Campaign is {campaign.status}, {campaign.wallets_credited} wallets / "
+            f"₦{campaign.total_credited} so far."
+        )
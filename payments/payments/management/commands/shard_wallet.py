@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payments import sharding
+from payments.models import Wallet
+
+
+class Command(BaseCommand):
+    help = "Turn sharded mode on/off for a wallet, or rebalance its shards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('wallet_id')
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--shards', type=int, help="Split the balance into this many shards.")
+        group.add_argument('--rebalance', action='store_true', help="Spread the balance evenly again.")
+        group.add_argument('--unshard', action='store_true', help="Fold the shards back into one balance.")
+
+    def handle(self, wallet_id, shards=None, rebalance=False, unshard=False, **options):
+        try:
+            wallet = Wallet.objects.get(wallet_id=wallet_id)
+        except Wallet.DoesNotExist:
+            raise CommandError(f"Wallet {wallet_id} not found")
+
+        try:
+            if shards:
+                sharding.enable_sharding(wallet, shards)
+            elif rebalance:
+                sharding.rebalance(wallet)
+            elif unshard:
+                sharding.disable_sharding(wallet)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        wallet.refresh_from_db()
+        self.stdout.write(
+            f"Wallet {wallet.wallet_id}: {wallet.shard_count} shards, total ₦{wallet.total_balance}"
+        )
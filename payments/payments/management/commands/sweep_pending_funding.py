@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from payments.gateway import get_gateway
+from payments.services import sweep_pending_funding
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify old PENDING funding attempts with the payment gateway: credit "
+        "the ones that were paid, expire the rest. Safe to run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-minutes', type=int, default=60)
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help="Gateway verify calls in flight at once.")
+
+    def handle(self, older_than_minutes, batch_size, concurrency, **options):
+        stats = sweep_pending_funding(
+            get_gateway(),
+            older_than=timedelta(minutes=older_than_minutes),
+            batch_size=batch_size,
+            concurrency=concurrency,
+        )
+        self.stdout.write(
+            "Checked {checked}: credited {credited}, expired {expired}, "
+            "left pending {skipped}".format(**stats)
+        )
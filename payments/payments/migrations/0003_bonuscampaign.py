@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_wallet_shard_count_walletshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BonusCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(max_length=40, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('CASHBACK', 'Cashback (% of spend)'), ('FLAT', 'Flat bonus')], default='CASHBACK', max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('max_credit', models.DecimalField(blank=True, decimal_places=2, help_text='Cap per wallet (optional)', max_digits=10, null=True)),
+                ('transaction_type', models.CharField(default='AIRTIME', max_length=20)),
+                ('network', models.CharField(blank=True, help_text='Blank = all networks', max_length=20, null=True)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('min_spend', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('status', models.CharField(choices=[('DRAFT', 'Draft'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed')], default='DRAFT', max_length=10)),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('wallets_credited', models.PositiveIntegerField(default=0)),
+                ('total_credited', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
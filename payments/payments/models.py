@@ -2,6 +2,8 @@ from django.db import models
 
 from django.db import models
 from django.conf import settings
+from django.db.models import Sum
+from decimal import Decimal
 import uuid
 
 class Wallet(models.Model):
@@ -23,13 +25,88 @@ class Wallet(models.Model):
     # Note: In production, we should hash this like a password.
     pin = models.CharField(max_length=4, default='0000', help_text="4-digit Transaction PIN")
    
+    # Sharded mode (for very busy reseller wallets): when > 0 the money lives
+    # in this many WalletShard rows and `balance` stays at 0, so concurrent
+    # purchases lock different rows instead of queueing on this one.
+    shard_count = models.PositiveSmallIntegerField(default=0)
+
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username} - ₦{self.balance}"
 
+    @property
+    def is_sharded(self):
+        return self.shard_count > 0
+
+    @property
+    def total_balance(self):
+        """The spendable balance, whichever mode the wallet is in."""
+        if not self.is_sharded:
+            return self.balance
+        return self.shards.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
+
     def save(self, *args, **kwargs):
         # Auto-generate a wallet ID if it doesn't exist
         if not self.wallet_id:
             self.wallet_id = str(uuid.uuid4().int)[:10] # Generates a random 10-digit number
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class WalletShard(models.Model):
+    """One slice of a sharded wallet's balance. See payments/sharding.py."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'index'], name='unique_wallet_shard_index'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet.wallet_id} #{self.index} - ₦{self.balance}"
+
+
+class BonusCampaign(models.Model):
+    """
+    A promotion that credits Wallet.bonus for users whose successful
+    transactions in a time window qualify. Run with
+    `manage.py run_bonus_campaign <code>`; see payments/campaigns.py.
+    """
+    KIND_CHOICES = (
+        ('CASHBACK', 'Cashback (% of spend)'),
+        ('FLAT', 'Flat bonus'),
+    )
+    STATUS_CHOICES = (
+        ('DRAFT', 'Draft'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+    )
+
+    code = models.SlugField(max_length=40, unique=True)
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='CASHBACK')
+    # CASHBACK: percent of qualifying spend. FLAT: naira per eligible wallet.
+    value = models.DecimalField(max_digits=10, decimal_places=2)
+    max_credit = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True,
+                                     help_text="Cap per wallet (optional)")
+
+    # --- Eligibility ---
+    transaction_type = models.CharField(max_length=20, default='AIRTIME')
+    network = models.CharField(max_length=20, blank=True, null=True, help_text="Blank = all networks")
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    min_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    # --- Progress (lets an interrupted run resume where it stopped) ---
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='DRAFT')
+    last_user_id = models.BigIntegerField(default=0)
+    wallets_credited = models.PositiveIntegerField(default=0)
+    total_credited = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.code} ({self.status})"
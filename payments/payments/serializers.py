@@ -1,9 +1,14 @@
 from rest_framework import serializers
 
 from rest_framework import serializers
+
+from core.validation import compile_serializer
 from .models import Wallet
 
 class WalletSerializer(serializers.ModelSerializer):
+    # Sharded wallets keep their money in sub-balances; show the total.
+    balance = serializers.DecimalField(max_digits=12, decimal_places=2, source='total_balance', read_only=True)
+
     class Meta:
         model = Wallet
         # We only show them safe info. Never expose internal IDs if not needed.
@@ -18,4 +23,26 @@ class FundWalletSerializer(serializers.Serializer):
     def validate_amount(self, value):
         if value < 100: # Minimum funding amount
             raise serializers.ValidationError("Minimum funding amount is ₦100.")
-        return value
\ No newline at end of file
+        return value
+
+# Same checks and errors as FundWalletSerializer (see core/validation.py).
+validate_fund_wallet = compile_serializer(FundWalletSerializer)
+
+
+class TransferItemSerializer(serializers.Serializer):
+    recipient_wallet_id = serializers.CharField(max_length=12)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Amount must be positive.")
+        return value
+
+
+class WalletTransferSerializer(TransferItemSerializer):
+    pin = serializers.CharField(max_length=4)
+
+
+class BulkTransferSerializer(serializers.Serializer):
+    pin = serializers.CharField(max_length=4)
+    transfers = TransferItemSerializer(many=True, allow_empty=False, max_length=1000)
@@ -0,0 +1,244 @@
+import logging
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from transactions.models import Transaction
+from .models import Wallet
+from . import sharding
+from .gateway import GatewayError
+
+logger = logging.getLogger(__name__)
+
+# Gateway statuses that mean the customer never paid (and won't now).
+UNPAID_STATUSES = ('failed', 'abandoned', 'reversed', 'not_found')
+
+
+def complete_funding(reference, api_response):
+    """
+    Credit a funding attempt that the gateway says was paid, and mark it
+    SUCCESS. Used by the webhook and the pending-funding sweeper.
+
+    EXPIRED attempts are settled too: the sweeper expires attempts the
+    gateway had no payment for, but the customer can still pay on that
+    reference later (e.g. from a checkout tab left open).
+    Raises Transaction.DoesNotExist if ``reference`` isn't a PENDING or
+    EXPIRED funding attempt (unknown, or already processed).
+    """
+    with transaction.atomic():
+        trx = Transaction.objects.select_for_update().get(
+            transaction_id=reference,
+            status__in=('PENDING', 'EXPIRED'),
+            transaction_type='FUNDING'
+        )
+
+        wallet = Wallet.objects.select_for_update().get(user_id=trx.user_id)
+
+        old_balance = wallet.total_balance
+        new_balance = old_balance + trx.amount
+
+        if wallet.is_sharded:
+            sharding.credit(wallet, trx.amount)
+        else:
+            wallet.balance = new_balance
+            wallet.save()
+
+        trx.status = 'SUCCESS'
+        trx.old_balance = old_balance
+        trx.new_balance = new_balance
+        trx.api_response = api_response
+        trx.save()
+    return trx
+
+
+def _verify(gateway, reference):
+    try:
+        return gateway.verify(reference)
+    except GatewayError as e:
+        logger.warning("Gateway verify failed for %s: %s", reference, e)
+        return None
+
+
+def sweep_pending_funding(gateway, older_than, batch_size=200, concurrency=8):
+    """
+    Settle funding attempts that have been PENDING for longer than
+    ``older_than`` (a timedelta).
+
+    Each batch is verified against the gateway concurrently. Attempts that
+    were actually paid (the webhook got lost) are credited. Attempts the
+    gateway says were never paid are marked EXPIRED with one UPDATE per
+    batch. Anything the gateway couldn't answer for stays PENDING for the
+    next run. Returns counts of what happened.
+    """
+    cutoff = timezone.now() - older_than
+    pending = Transaction.objects.filter(
+        status='PENDING', transaction_type='FUNDING', created_at__lt=cutoff,
+    )
+    stats = {'checked': 0, 'credited': 0, 'expired': 0, 'skipped': 0}
+    after = Q()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            # Keyset pagination on (created_at, pk), the columns of
+            # pending_funding_idx: rows we skip stay PENDING, so OFFSET
+            # would drift and re-read them forever.
+            batch = list(
+                pending.filter(after).order_by('created_at', 'pk')
+                .values_list('pk', 'created_at', 'transaction_id', 'amount')[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk, last_created_at = batch[-1][:2]
+            after = Q(created_at__gt=last_created_at) | Q(created_at=last_created_at, pk__gt=last_pk)
+            results = pool.map(lambda row: _verify(gateway, row[2]), batch)
+
+            expire = []
+            for (pk, _, reference, amount), result in zip(batch, results):
+                stats['checked'] += 1
+                if result is None:
+                    stats['skipped'] += 1
+                elif result['status'] == 'success':
+                    if result['amount'] < amount:
+                        logger.warning("Gateway paid %s for %s but %s was expected; leaving PENDING",
+                                       result['amount'], reference, amount)
+                        stats['skipped'] += 1
+                        continue
+                    try:
+                        complete_funding(reference, result['raw_response'])
+                        stats['credited'] += 1
+                    except Transaction.DoesNotExist:
+                        pass  # The webhook got there first.
+                elif result['status'] in UNPAID_STATUSES:
+                    expire.append(pk)
+                else:
+                    # Still in progress at the gateway ('ongoing', 'pending', ...)
+                    stats['skipped'] += 1
+
+            if expire:
+                # status='PENDING' again: a webhook may have landed meanwhile.
+                stats['expired'] += Transaction.objects.filter(
+                    pk__in=expire, status='PENDING',
+                ).update(status='EXPIRED', updated_at=timezone.now())
+
+    return stats
+
+
+class TransferError(Exception):
+    """A transfer was refused (bad recipient, insufficient funds, ...)."""
+
+
+def _lock_wallets(source_wallet, recipient_wallet_ids):
+    """
+    Lock the source wallet and every recipient wallet in ONE query, always in
+    primary key order. Because every transfer takes its locks in the same
+    order, concurrent A->B and B->A transfers queue up instead of deadlocking.
+    Must be called inside transaction.atomic().
+    """
+    wallets = (
+        Wallet.objects.select_for_update()
+        .filter(Q(pk=source_wallet.pk) | Q(wallet_id__in=recipient_wallet_ids))
+        .order_by('pk')
+    )
+    return list(wallets)
+
+
+def bulk_transfer(source_wallet, transfers, description=None):
+    """
+    Move money from ``source_wallet`` to many wallets in one locked pass.
+
+    ``transfers`` is a list of ``(recipient_wallet_id, amount)`` pairs. Either
+    every transfer is applied or none is. Returns ``(reference, new_balance)``:
+    the reference shared by all the Transaction rows written for this batch
+    and the source wallet's balance afterwards.
+    """
+    if not transfers:
+        raise TransferError("No transfers given.")
+
+    recipient_ids = {wallet_id for wallet_id, _ in transfers}
+    if source_wallet.wallet_id in recipient_ids:
+        raise TransferError("You cannot transfer to your own wallet.")
+
+    total = sum(amount for _, amount in transfers)
+    reference = f"TRF-{uuid.uuid4().hex[:12].upper()}"
+    now = timezone.now()
+
+    with transaction.atomic():
+        locked = _lock_wallets(source_wallet, recipient_ids)
+        source = next((w for w in locked if w.pk == source_wallet.pk), None)
+        if source is None:
+            raise TransferError("Wallet not found.")
+        recipients = {w.wallet_id: w for w in locked if w.pk != source.pk}
+
+        missing = recipient_ids - recipients.keys()
+        if missing:
+            raise TransferError(f"Recipient wallet not found: {', '.join(sorted(missing))}")
+
+        # Running balances; sharded wallets report the sum of their shards.
+        balances = {w.pk: w.total_balance for w in locked}
+        if balances[source.pk] < total:
+            raise TransferError("Insufficient funds")
+
+        records = []
+        received = defaultdict(Decimal)
+        for wallet_id, amount in transfers:
+            recipient = recipients[wallet_id]
+            received[recipient.pk] += amount
+
+            # Debit side
+            source_old = balances[source.pk]
+            balances[source.pk] -= amount
+            records.append(Transaction(
+                user_id=source.user_id,
+                transaction_type='TRANSFER_OUT',
+                reference=reference,
+                amount=amount,
+                old_balance=source_old,
+                new_balance=balances[source.pk],
+                status='SUCCESS',
+                description=description or f"Transfer of ₦{amount} to wallet {wallet_id}",
+            ))
+
+            # Credit side
+            recipient_old = balances[recipient.pk]
+            balances[recipient.pk] += amount
+            records.append(Transaction(
+                user_id=recipient.user_id,
+                transaction_type='TRANSFER_IN',
+                reference=reference,
+                amount=amount,
+                old_balance=recipient_old,
+                new_balance=balances[recipient.pk],
+                status='SUCCESS',
+                description=description or f"Transfer of ₦{amount} from wallet {source.wallet_id}",
+            ))
+
+        # Sharded wallets move money through their shards, not Wallet.balance.
+        if source.is_sharded:
+            try:
+                sharding.debit(source, total)
+            except sharding.InsufficientFunds:
+                raise TransferError("Insufficient funds")
+        for recipient in recipients.values():
+            if recipient.is_sharded:
+                sharding.credit(recipient, received[recipient.pk])
+
+        # bulk_update skips auto_now, so stamp updated_at ourselves.
+        changed = [w for w in locked if not w.is_sharded]
+        for wallet in changed:
+            wallet.balance = balances[wallet.pk]
+            wallet.updated_at = now
+        if changed:
+            Wallet.objects.bulk_update(changed, ['balance', 'updated_at'])
+        Transaction.objects.bulk_create(records)
+
+    return reference, balances[source.pk]
+
+
+def transfer(source_wallet, recipient_wallet_id, amount, description=None):
+    """Move ``amount`` from ``source_wallet`` to the wallet with ``recipient_wallet_id``."""
+    return bulk_transfer(source_wallet, [(recipient_wallet_id, amount)], description)
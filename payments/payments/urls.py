@@ -1,10 +1,12 @@
 from django.urls import path
 # Make sure all three views are imported!
-from .views import WalletBalanceView, InitializeFundingView, FundingWebhookView
+from .views import WalletBalanceView, InitializeFundingView, FundingWebhookView, WalletTransferView, BulkWalletTransferView
 
 urlpatterns = [
     path('balance/', WalletBalanceView.as_view(), name='wallet-balance'),
     path('fund/initialize/', InitializeFundingView.as_view(), name='fund-initialize'),
     # This is the line that is likely missing or broken:
     path('fund/webhook/', FundingWebhookView.as_view(), name='fund-webhook'),
+    path('transfer/', WalletTransferView.as_view(), name='wallet-transfer'),
+    path('transfer/bulk/', BulkWalletTransferView.as_view(), name='wallet-transfer-bulk'),
 ]
\ No newline at end of file
@@ -3,15 +3,22 @@ from rest_framework.views import APIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.db import transaction
+import logging
 import uuid
 
+from core import log
+from core.db_router import PinnedReadsMixin
+from core.validation import json_body
+
 from .models import Wallet
 from transactions.models import Transaction
-# Ensure FundWalletSerializer is imported here:
-from .serializers import WalletSerializer, FundWalletSerializer
+# Ensure validate_fund_wallet is imported here:
+from .serializers import WalletSerializer, validate_fund_wallet, WalletTransferSerializer, BulkTransferSerializer
+from .services import TransferError, transfer, bulk_transfer, complete_funding
+
+logger = logging.getLogger(__name__)
 
-class WalletBalanceView(APIView):
+class WalletBalanceView(PinnedReadsMixin, APIView):
     # SECURITY: Only logged-in users can access this!
     permission_classes = [IsAuthenticated]
 
@@ -37,11 +44,11 @@ class InitializeFundingView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        serializer = FundWalletSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=400)
+        data, errors = validate_fund_wallet(json_body(request))
+        if errors:
+            return Response(errors, status=400)
 
-        amount = serializer.validated_data['amount']
+        amount = data['amount']
         user = request.user
 
         # Generate a unique reference for this deposit attempt
@@ -82,50 +89,104 @@ class FundingWebhookView(APIView):
         # 1. Simulate getting data from gateway.
         # In reality, Paystack sends a big JSON object. We just need the reference.
         # Let's assume they send: {"event": "charge.success", "data": {"reference": "..."}}
-       
-        gateway_data = request.data.get('data', {})
+        # json_body() decodes the raw bytes directly, without DRF's parser stack.
+        payload = json_body(request)
+        gateway_data = payload.get('data') if hasattr(payload, 'get') else None
+        if not isinstance(gateway_data, dict):
+            gateway_data = {}
         reference = gateway_data.get('reference')
         status = gateway_data.get('status')
 
+        log.bind(transaction_id=reference)
+
         if not reference or status != 'success':
              # Ignore incomplete or failed notifications
             return Response({"status": "ignored"}, status=200)
 
         try:
-            # 2. Find the PENDING transaction
-            with transaction.atomic():
-                trx = Transaction.objects.select_for_update().get(
-                    transaction_id=reference,
-                    status='PENDING',
-                    transaction_type='FUNDING'
-                )
-
-                # 3. Find the user's wallet
-                wallet = Wallet.objects.select_for_update().get(user=trx.user)
-
-                # 4. Add money & update records
-                old_balance = wallet.balance
-                new_balance = wallet.balance + trx.amount
-               
-                wallet.balance = new_balance
-                wallet.save()
-
-                trx.status = 'SUCCESS'
-                trx.old_balance = old_balance
-                trx.new_balance = new_balance
-                # Save the raw data from gateway for debugging
-                trx.api_response = request.data
-                trx.save()
-
-                print(f"Webhook Success: Funded {trx.amount} for ref {reference}")
-                # Always return 200 OK to the gateway immediately
-                return Response({"status": "processed"}, status=200)
+            # 2-4. Find the PENDING transaction, credit the wallet, mark it SUCCESS
+            # Save the raw data from gateway for debugging
+            trx = complete_funding(reference, payload)
+
+            logger.info("Webhook Success: Funded %s for ref %s", trx.amount, reference)
+            # Always return 200 OK to the gateway immediately
+            return Response({"status": "processed"}, status=200)
 
         except Transaction.DoesNotExist:
             # Transaction already processed or invalid ref
-            print(f"Webhook Error: Invalid ref {reference}")
+            logger.warning("Webhook Error: Invalid ref %s", reference)
             return Response({"status": "invalid_reference"}, status=200)
         except Exception as e:
-            print(f"Webhook Critical Error: {e}")
+            logger.exception("Webhook Critical Error: %s", e)
             # Gateways usually retry if you send a 500 error
-            return Response({"status": "error"}, status=500)
\ No newline at end of file
+            return Response({"status": "error"}, status=500)
+
+
+class WalletTransferView(APIView):
+    """
+    Send money from the logged-in user's wallet to another wallet.
+    Body: {"recipient_wallet_id": "...", "amount": "500.00", "pin": "1234"}
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = WalletTransferSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        data = serializer.validated_data
+
+        try:
+            wallet = Wallet.objects.get(user=request.user)
+        except Wallet.DoesNotExist:
+            return Response({"error": "Wallet not found"}, status=404)
+
+        if wallet.pin != data['pin']:
+            return Response({"error": "Invalid transaction PIN"}, status=403)
+
+        try:
+            reference, new_balance = transfer(wallet, data['recipient_wallet_id'], data['amount'])
+        except TransferError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({
+            "status": "success",
+            "message": "Transfer successful",
+            "reference": reference,
+            "new_balance": new_balance
+        })
+
+
+class BulkWalletTransferView(APIView):
+    """
+    Reseller payouts: many transfers from one wallet, applied all-or-nothing
+    in a single locked pass.
+    Body: {"pin": "1234", "transfers": [{"recipient_wallet_id": "...", "amount": "100"}, ...]}
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkTransferSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        data = serializer.validated_data
+
+        try:
+            wallet = Wallet.objects.get(user=request.user)
+        except Wallet.DoesNotExist:
+            return Response({"error": "Wallet not found"}, status=404)
+
+        if wallet.pin != data['pin']:
+            return Response({"error": "Invalid transaction PIN"}, status=403)
+
+        transfers = [(t['recipient_wallet_id'], t['amount']) for t in data['transfers']]
+        try:
+            reference, new_balance = bulk_transfer(wallet, transfers)
+        except TransferError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({
+            "status": "success",
+            "message": f"{len(transfers)} transfers successful",
+            "reference": reference,
+            "new_balance": new_balance
+        })
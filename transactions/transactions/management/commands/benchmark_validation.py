@@ -0,0 +1,121 @@
+import io
+import json
+import time
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from core.validation import json_body
+from payments.serializers import FundWalletSerializer, validate_fund_wallet
+from transactions.serializers import AirtimePurchaseSerializer, validate_airtime_purchase
+
+# Shaped like a real Paystack charge.success notification (~2 KB).
+WEBHOOK_BODY = json.dumps({
+    'event': 'charge.success',
+    'data': {
+        'id': 302961, 'domain': 'live', 'status': 'success', 'reference': 'FUND-42-9F8E7D6C',
+        'amount': 500000, 'message': None, 'gateway_response': 'Approved by Financial Institution',
+        'paid_at': '2026-10-19T10:00:00.000Z', 'created_at': '2026-10-19T09:59:41.000Z',
+        'channel': 'card', 'currency': 'NGN', 'ip_address': '197.210.54.33',
+        'metadata': {'custom_fields': [{'display_name': 'Wallet', 'variable_name': 'wallet', 'value': '4821930571'}]},
+        'log': {
+            'time_spent': 16, 'attempts': 1, 'authentication': 'pin', 'errors': 0, 'success': True,
+            'mobile': False, 'input': [],
+            'history': [{'type': t, 'message': m, 'time': i} for i, (t, m) in enumerate([
+                ('input', 'Filled these fields: card number, card expiry, card cvv'),
+                ('action', 'Attempted to pay'),
+                ('auth', 'Authentication Required: pin'),
+                ('success', 'Successfully paid'),
+            ])],
+        },
+        'fees': 7500, 'fees_split': None,
+        'authorization': {
+            'authorization_code': 'AUTH_8dfhjjdt', 'bin': '539999', 'last4': '8877', 'exp_month': '08',
+            'exp_year': '2028', 'channel': 'card', 'card_type': 'mastercard DEBIT', 'bank': 'Guaranty Trust Bank',
+            'country_code': 'NG', 'brand': 'mastercard', 'reusable': True, 'signature': 'SIG_idyuhgd87dUYSHO92D',
+            'account_name': None,
+        },
+        'customer': {
+            'id': 84312, 'first_name': 'Ada', 'last_name': 'Obi', 'email': 'ada@example.com',
+            'customer_code': 'CUS_hdhye17yj8qd2tx', 'phone': '08031234567', 'metadata': None,
+            'risk_action': 'default',
+        },
+        'plan': {}, 'subaccount': {}, 'split': {}, 'order_id': None,
+        'requested_amount': 500000, 'source': {'type': 'web', 'source': 'checkout', 'identifier': None},
+    },
+}).encode()
+
+
+def make_request(body):
+    django_request = WSGIRequest({
+        'REQUEST_METHOD': 'POST', 'PATH_INFO': '/api/payments/fund/webhook/',
+        'SERVER_NAME': 'bench', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    })
+    return Request(django_request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+
+
+def with_serializer(serializer_class, payload):
+    serializer = serializer_class(data=payload)
+    serializer.is_valid()
+    return serializer.validated_data, serializer.errors
+
+
+def webhook_with_request_data():
+    data = make_request(WEBHOOK_BODY).data.get('data', {})
+    return data.get('reference'), data.get('status')
+
+
+def webhook_with_json_body():
+    data = json_body(make_request(WEBHOOK_BODY)).get('data', {})
+    return data.get('reference'), data.get('status')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare CPU time per request of the DRF serializers / request.data "
+        "against the compiled validators and json_body() (core/validation.py) "
+        "used by buy-airtime, fund/initialize and the funding webhook."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, iterations, **options):
+        purchase = {'network': 'MTN', 'phone_number': '08031234567', 'amount': '500'}
+        bad_purchase = {'network': 'VODAFONE', 'phone_number': '', 'amount': '-5'}
+        cases = [
+            ('buy-airtime valid',
+             lambda: with_serializer(AirtimePurchaseSerializer, purchase),
+             lambda: validate_airtime_purchase(purchase)),
+            ('buy-airtime invalid',
+             lambda: with_serializer(AirtimePurchaseSerializer, bad_purchase),
+             lambda: validate_airtime_purchase(bad_purchase)),
+            ('fund valid',
+             lambda: with_serializer(FundWalletSerializer, {'amount': '5000'}),
+             lambda: validate_fund_wallet({'amount': '5000'})),
+            ('webhook parse',
+             webhook_with_request_data,
+             webhook_with_json_body),
+        ]
+
+        self.stdout.write(f"{iterations} iterations per case, CPU microseconds per request\n")
+        self.stdout.write(f"{'case':<22} {'current':>10} {'fast':>10} {'speedup':>8}")
+        for name, current, fast in cases:
+            # Both paths must agree before timing them means anything.
+            if current() != fast():
+                raise CommandError(f"{name}: compiled result differs from the serializer's")
+            before = self._cpu_us(current, iterations)
+            after = self._cpu_us(fast, iterations)
+            self.stdout.write(f"{name:<22} {before:>10.1f} {after:>10.1f} {before / after:>7.1f}x")
+
+    def _cpu_us(self, fn, iterations):
+        for _ in range(min(iterations, 1000)):
+            fn()  # warm up
+        started = time.process_time()
+        for _ in range(iterations):
+            fn()
+        return (time.process_time() - started) / iterations * 1e6
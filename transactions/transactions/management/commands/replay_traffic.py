@@ -0,0 +1,214 @@
+import json
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from core import traffic
+from payments.models import Wallet
+from transactions.models import Transaction
+
+# Large enough never to run out, small enough for Transaction.old_balance/new_balance
+# (max_digits=10).
+REPLAY_BALANCE = Decimal('90000000.00')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay captured buy-airtime / webhook traffic (TRAFFIC_CAPTURE_PATH) "
+        "through the real views. The vendor is replaced by the recorded "
+        "replies and latencies. Prints throughput and latency, optionally "
+        "saving them to compare with a later run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture_file')
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help="1 = recorded pacing, 10 = ten times faster, 0 = as fast as possible.")
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help="Requests in flight at once (like gunicorn worker threads).")
+        parser.add_argument('--vendor-latency-scale', type=float, default=1.0,
+                            help="Multiply recorded vendor latencies, 0 to skip them.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="Results JSON from an earlier run to compare against.")
+        parser.add_argument('--keep-data', action='store_true',
+                            help="Keep the replay users and their transactions afterwards.")
+        parser.add_argument('--force', action='store_true',
+                            help="Allow running with RUNTIME_PROFILE=production.")
+
+    def handle(self, capture_file, speed, concurrency, vendor_latency_scale,
+               output=None, compare=None, keep_data=False, force=False, **options):
+        if settings.PRODUCTION and not force:
+            raise CommandError("Replay writes users and transactions; refusing in production without --force.")
+
+        records = sorted(traffic.read_capture(capture_file), key=lambda r: r['time'])
+        if not records:
+            raise CommandError("Capture file is empty.")
+
+        run_id = uuid.uuid4().hex[:6]
+        users = self._prepare(records, run_id)
+        try:
+            # Replays are paced by --speed, not by live rate limits: lift the
+            # purchase throttles and keep the buckets / vendor gate apart from
+            # the live ones on this host.
+            with tempfile.TemporaryDirectory() as shm_dir, override_settings(
+                VTU_VENDOR='transactions.services.ReplayVendor',
+                TRAFFIC_CAPTURE_PATH=None,
+                PURCHASE_USER_RATE=1e9,
+                PURCHASE_USER_BURST=1e9,
+                PURCHASE_NETWORK_RATE=1e9,
+                PURCHASE_NETWORK_BURST=1e9,
+                ADMISSION_SHM_DIR=shm_dir,
+            ):
+                results, wall = self._replay(records, users, speed, concurrency, vendor_latency_scale)
+        finally:
+            if not keep_data:
+                for user in users.values():
+                    user.delete()
+
+        summary = self._summarize(results, wall)
+        self._report(summary)
+        if output:
+            with open(output, 'w') as f:
+                json.dump(summary, f, indent=2)
+        if compare:
+            with open(compare) as f:
+                self._compare(json.load(f), summary)
+
+    def _prepare(self, records, run_id):
+        """
+        Create throwaway users (with huge balances) standing in for the
+        recorded ones, and the PENDING funding rows the webhooks will settle.
+        """
+        User = get_user_model()
+        users = {}
+
+        def replay_user(key):
+            if key not in users:
+                user = User.objects.create_user(username=f"replay-{run_id}-{key}")
+                Wallet.objects.update_or_create(user=user, defaults={'balance': REPLAY_BALANCE})
+                users[key] = user
+            return users[key]
+
+        for record in records:
+            if record['user'] is not None:
+                record['replay_user'] = replay_user(record['user'])
+            if record['view'] == 'fund-webhook':
+                data = record['body'].get('data') or {}
+                if data.get('reference'):
+                    # Unique per run so replays can be repeated on one database.
+                    data['reference'] = f"{data['reference']}-{run_id}"
+                    Transaction.objects.create(
+                        user=replay_user('funding'),
+                        transaction_id=data['reference'],
+                        transaction_type='FUNDING',
+                        amount=Decimal(data.get('amount') or 10000) / 100,
+                        status='PENDING',
+                    )
+        return users
+
+    def _replay(self, records, users, speed, concurrency, latency_scale):
+        local = threading.local()
+
+        def client_for(user):
+            # One logged-in client per (thread, user): logging in writes a session.
+            clients = local.__dict__.setdefault('clients', {})
+            key = user.pk if user else None
+            if key not in clients:
+                clients[key] = Client()
+                if user:
+                    clients[key].force_login(user)
+            return clients[key]
+
+        def replay_one(record):
+            client = client_for(record.get('replay_user'))
+            token = traffic.replay_vendor_calls(record['vendor'], latency_scale)
+            started = time.monotonic()
+            try:
+                response = client.post(
+                    record['path'], data=json.dumps(record['body']), content_type='application/json',
+                )
+            finally:
+                traffic.stop_replay(token)
+            return record['view'], response.status_code, time.monotonic() - started, record.get('status')
+
+        t0 = records[0]['time']
+        futures = []
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for record in records:
+                if speed > 0:
+                    delay = started + (record['time'] - t0) / speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                futures.append(pool.submit(replay_one, record))
+            results = [f.result() for f in futures]
+        return results, time.monotonic() - started
+
+    def _summarize(self, results, wall):
+        by_view = defaultdict(list)
+        for view, status, latency, recorded_status in results:
+            by_view[view].append((status, latency, recorded_status))
+
+        views = {}
+        for view, rows in by_view.items():
+            latencies = [latency * 1000 for _, latency, _ in rows]
+            statuses = defaultdict(int)
+            for status, _, _ in rows:
+                statuses[str(status)] += 1
+            views[view] = {
+                'requests': len(rows),
+                'p50_ms': round(percentile(latencies, 50), 1),
+                'p95_ms': round(percentile(latencies, 95), 1),
+                'p99_ms': round(percentile(latencies, 99), 1),
+                'max_ms': round(max(latencies), 1),
+                'statuses': dict(statuses),
+                'status_mismatches': sum(1 for s, _, rec in rows if rec is not None and s != rec),
+            }
+        return {
+            'requests': len(results),
+            'wall_seconds': round(wall, 3),
+            'throughput_rps': round(len(results) / wall, 1) if wall else 0,
+            'views': views,
+        }
+
+    def _report(self, summary):
+        self.stdout.write(
+            f"{summary['requests']} requests in {summary['wall_seconds']}s "
+            f"= {summary['throughput_rps']} req/s"
+        )
+        for view, stats in summary['views'].items():
+            self.stdout.write(
+                f"  {view}: n={stats['requests']} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms "
+                f"p99={stats['p99_ms']}ms max={stats['max_ms']}ms statuses={stats['statuses']} "
+                f"mismatched-vs-recorded={stats['status_mismatches']}"
+            )
+
+    def _compare(self, before, after):
+        def change(old, new):
+            return f"{old} -> {new} ({(new - old) / old * 100:+.1f}%)" if old else f"{old} -> {new}"
+
+        self.stdout.write("Compared with previous run:")
+        self.stdout.write(f"  throughput req/s: {change(before['throughput_rps'], after['throughput_rps'])}")
+        for view, stats in after['views'].items():
+            old = before['views'].get(view)
+            if not old:
+                continue
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                self.stdout.write(f"  {view} {key}: {change(old[key], stats[key])}")
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('AIRTIME', 'Airtime Topup'), ('DATA', 'Data Bundle'), ('CABLE', 'Cable TV Subscription'), ('ELECTRICITY', 'Electricity Bill'), ('FUNDING', 'Wallet Funding'), ('TRANSFER_OUT', 'Wallet Transfer (Sent)'), ('TRANSFER_IN', 'Wallet Transfer (Received)')], max_length=20),
+        ),
+    ]
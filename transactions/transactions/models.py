@@ -12,6 +12,9 @@ class Transaction(models.Model):
         ('CABLE', 'Cable TV Subscription'),
         ('ELECTRICITY', 'Electricity Bill'),
         ('FUNDING', 'Wallet Funding'),
+        ('TRANSFER_OUT', 'Wallet Transfer (Sent)'),
+        ('TRANSFER_IN', 'Wallet Transfer (Received)'),
+        ('BONUS', 'Bonus / Cashback'),
     )
 
     # Status Types
@@ -20,6 +23,7 @@ class Transaction(models.Model):
         ('SUCCESS', 'Successful'),
         ('FAILED', 'Failed'),
         ('REFUNDED', 'Refunded'),
+        ('EXPIRED', 'Expired'),
     )
 
     # NETWORKS (You can expand this later)
@@ -68,6 +72,17 @@ class Transaction(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Most funding attempts are abandoned. This index only holds the
+            # still-PENDING ones, so it stays small however big the table
+            # gets; the pending-funding sweeper pages through it by
+            # (created_at, id).
+            models.Index(
+                fields=['created_at', 'id'],
+                name='pending_funding_idx',
+                condition=models.Q(status='PENDING', transaction_type='FUNDING'),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} - {self.amount}"
\ No newline at end of file
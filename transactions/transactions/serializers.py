@@ -1,4 +1,6 @@
 from rest_framework import serializers
+
+from core.validation import compile_serializer
 from .models import Transaction
 
 class AirtimePurchaseSerializer(serializers.Serializer):
@@ -10,4 +12,9 @@ class AirtimePurchaseSerializer(serializers.Serializer):
         """Ensure amount is positive."""
         if value <= 0:
             raise serializers.ValidationError("Amount must be positive.")
-        return value
\ No newline at end of file
+        return value
+
+
+# Same checks and errors as AirtimePurchaseSerializer, without building a
+# serializer per request (see core/validation.py).
+validate_airtime_purchase = compile_serializer(AirtimePurchaseSerializer)
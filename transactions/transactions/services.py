@@ -2,8 +2,12 @@ import requests
 
 import requests
 import logging
+import time
 from django.conf import settings
 
+from core import log, traffic
+from .vendor_float import vendor_float, parse_balance, reports_insufficient_float
+
 # Set up a logger so we can see what's happening in the terminal/logs
 logger = logging.getLogger(__name__)
 
@@ -23,6 +27,9 @@ class RealVTUVendor:
         '9MOBILE': '04',
     }
 
+    # Keep the shared vendor float cache (vendor_float.py) up to date.
+    tracks_float = True
+
     def __init__(self):
         # Load credentials securely from settings.py (which got them from .env)
         self.user_id = settings.VTU_API_USERID
@@ -34,14 +41,64 @@ class RealVTUVendor:
             logger.error("VTU Vendor credentials not configured in settings.")
             raise Exception("Vendor credentials missing.")
 
+    def _send(self, endpoint, params):
+        """The actual HTTP call. Replay runs swap this out (see core/traffic.py)."""
+        started = time.monotonic()
+        try:
+            # We use a 30-second timeout so our server doesn't hang forever if theirs is down.
+            response = requests.get(endpoint, params=params, timeout=30)
+        except requests.exceptions.RequestException as e:
+            traffic.record_vendor_call(None, str(e), time.monotonic() - started)
+            raise
+        traffic.record_vendor_call(response.status_code, response.text, time.monotonic() - started)
+        return response
+
+    def get_balance(self):
+        """
+        Our remaining prepaid balance with the vendor, or None if we couldn't
+        find out. Polled by vendor_float.py.
+        """
+        endpoint = f"{self.base_url.rstrip('/')}/APIWalletBalanceV1.asp"
+        params = {'UserID': self.user_id, 'APIKey': self.api_key}
+        try:
+            response = requests.get(endpoint, params=params, timeout=10)
+            response.raise_for_status()
+            return parse_balance(response.json())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Vendor balance check failed: %s", e)
+            return None
+
     def purchase_airtime(self, network, phone, amount, ref_id):
+        """
+        Buys airtime, keeping the cached vendor float in step: the amount is
+        reserved before the call and given back if the purchase fails.
+        """
+        if not self.tracks_float:
+            return self._purchase_airtime(network, phone, amount, ref_id)
+
+        vendor_float.reserve(amount)
+        result = self._purchase_airtime(network, phone, amount, ref_id)
+
+        raw = result.get('raw_response') or {}
+        balance = parse_balance(raw)
+        if balance is not None:
+            vendor_float.sync(balance)
+        elif result['status'] != 'success':
+            if reports_insufficient_float(raw, result['message']):
+                logger.error("Vendor reports insufficient float: %s", result['message'])
+                vendor_float.sync(0)
+            else:
+                vendor_float.release(amount)
+        return result
+
+    def _purchase_airtime(self, network, phone, amount, ref_id):
         """
         Sends the actual HTTP request to the vendor to buy airtime.
         """
         # 1. Get the correct vendor network ID
         vendor_network_id = self.NETWORK_MAPPING.get(network.upper())
         if not vendor_network_id:
-            logger.error(f"Unsupported network attempted: {network}")
+            logger.error("Unsupported network attempted: %s", network)
             return {
                 "status": "failed",
                 "message": f"Unsupported network: {network}",
@@ -65,12 +122,13 @@ class RealVTUVendor:
         # Double-check the exact endpoint name in your vendor's docs.
         endpoint = f"{self.base_url.rstrip('/')}/GetCredit.asp"
 
-        logger.info(f"Calling Vendor API: {endpoint} with params (excluding keys): MobileNo={phone}, Amount={amount}, Ref={ref_id}")
+        log.bind(vendor_request_id=ref_id)
+        logger.info("Calling Vendor API: %s with params (excluding keys): MobileNo=%s, Amount=%s, Ref=%s",
+                    endpoint, phone, amount, ref_id)
 
         try:
             # 3. FIRE THE REQUEST! 🚀
-            # We use a 30-second timeout so our server doesn't hang forever if theirs is down.
-            response = requests.get(endpoint, params=params, timeout=30)
+            response = self._send(endpoint, params)
            
             # Raise an exception if the HTTP status is bad (e.g., 404, 500)
             response.raise_for_status()
@@ -78,7 +136,9 @@ class RealVTUVendor:
             # 4. Parse the response
             # Clubkonnect returns JSON. We need to convert it to a Python dictionary.
             response_data = response.json()
-            logger.info(f"Vendor Response Raw: {response.text}")
+            payload = log.vendor_payload(response.text)
+            if payload is not None:
+                logger.info("Vendor Response Raw: %s", payload)
 
             # 5. Interpret the result based on Vendor's rules
             # Clubkonnect convention: "status" key indicates outcome.
@@ -111,7 +171,7 @@ class RealVTUVendor:
                 # --- UNKNOWN / PENDING STATE ---
                 # If we get a weird status code, it's safer to mark it failed and refund
                 # than to assume it worked.
-                logger.warning(f"Unknown vendor status code: {vendor_status_code}")
+                logger.warning("Unknown vendor status code: %s", vendor_status_code)
                 return {
                     "status": "failed",
                     "message": f"Vendor returned unknown status: {vendor_status_code}",
@@ -121,7 +181,7 @@ class RealVTUVendor:
 
         except requests.exceptions.RequestException as e:
             # This handles network errors (DNS failure, connection timeout, etc.)
-            logger.error(f"HTTP Request failed: {e}")
+            logger.error("HTTP Request failed: %s", e)
             return {
                 "status": "failed",
                 "message": "Unable to connect to network provider. Please try again later.",
@@ -130,10 +190,36 @@ class RealVTUVendor:
             }
         except ValueError as e:
              # This handles cases where the vendor sends back invalid JSON
-            logger.error(f"Failed to parse vendor JSON response: {e}. Raw body: {response.text}")
+            logger.error("Failed to parse vendor JSON response: %s. Raw body: %s", e, log.vendor_payload(response.text))
             return {
                 "status": "failed",
                 "message": "Bad response from network provider.",
                 "vendor_reference": None,
                 "raw_response": {"error": "Invalid JSON", "body": response.text}
-            }
\ No newline at end of file
+            }
+
+
+class ReplayVendor(RealVTUVendor):
+    """
+    RealVTUVendor with the HTTP call replaced by a recorded reply (see
+    core/traffic.py and `manage.py replay_traffic`), so all of the real
+    response handling still runs.
+    """
+
+    # Replays must not disturb the live float cache.
+    tracks_float = False
+
+    def __init__(self):
+        self.user_id = 'replay'
+        self.api_key = 'replay'
+        self.base_url = 'http://vendor.replay'
+
+    def _send(self, endpoint, params):
+        response = traffic.next_replayed_call()
+        if response is None:
+            # Nothing recorded for this call: behave like a vendor-side failure.
+            response = traffic.ReplayResponse(200, {'status': '200', 'msg': 'No recorded vendor reply'})
+        return response
+
+    def get_balance(self):
+        return None
@@ -1,3 +1,362 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core import traffic
+from core.log import BackgroundQueueHandler, JsonFormatter
+from payments import sharding
+from payments.models import Wallet
+from .models import Transaction
+from .serializers import AirtimePurchaseSerializer, validate_airtime_purchase
+from .services import ReplayVendor
+from .vendor_float import VendorFloat, vendor_float
+
+User = get_user_model()
+
+
+def isolate_admission_state(test):
+    """Give ``test`` its own token buckets, vendor gate and vendor float (ADMISSION_SHM_DIR)."""
+    shm_dir = tempfile.TemporaryDirectory()
+    test.addCleanup(shm_dir.cleanup)
+    settings_override = override_settings(ADMISSION_SHM_DIR=shm_dir.name)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
+@override_settings(VTU_VENDOR='transactions.services.ReplayVendor')
+class BuyAirtimeReplayTests(TestCase):
+    """Drive BuyAirtimeView with recorded vendor replies (see core/traffic.py)."""
+
+    def setUp(self):
+        isolate_admission_state(self)
+        self.user = User.objects.create_user(username='buyer', password='x')
+        Wallet.objects.update_or_create(user=self.user, defaults={'balance': Decimal('1000.00')})
+        self.client.force_login(self.user)
+
+    def buy(self, vendor_calls, amount='200'):
+        token = traffic.replay_vendor_calls(vendor_calls, latency_scale=0)
+        try:
+            return self.client.post(
+                '/api/transactions/buy-airtime/',
+                {'network': 'MTN', 'phone_number': '08030000000', 'amount': amount},
+                content_type='application/json',
+            )
+        finally:
+            traffic.stop_replay(token)
+
+    def test_recorded_success_debits_wallet(self):
+        response = self.buy([{'status_code': 200, 'body': {'status': '100', 'orderid': 'X1'}, 'latency_ms': 5}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('800.00'))
+        self.assertEqual(Transaction.objects.get().reference, 'X1')
+
+    def test_recorded_vendor_failure_refunds(self):
+        response = self.buy([{'status_code': 200, 'body': {'status': '200', 'msg': 'LOW BALANCE'}, 'latency_ms': 5}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, Decimal('1000.00'))
+        self.assertEqual(Transaction.objects.get().status, 'FAILED')
+
+    def test_insufficient_funds(self):
+        response = self.buy([], amount='5000')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_sharded_wallet_success_debits_one_shard(self):
+        wallet = sharding.enable_sharding(Wallet.objects.get(user=self.user), 4)
+
+        response = self.buy([{'status_code': 200, 'body': {'status': '100', 'orderid': 'X1'}, 'latency_ms': 5}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.json()['new_balance'])), Decimal('800.00'))
+        self.assertEqual(wallet.total_balance, Decimal('800.00'))
+        self.assertEqual(sorted(wallet.shards.values_list('balance', flat=True)), [Decimal('50.00')] + [Decimal('250.00')] * 3)
+        self.assertEqual(Transaction.objects.get().new_balance, Decimal('800.00'))
+
+    def test_sharding_disabled_mid_purchase_pays_from_plain_balance(self):
+        wallet = sharding.enable_sharding(Wallet.objects.get(user=self.user), 4)
+        debit = sharding.debit
+
+        def disable_then_debit(wallet, amount):
+            # disable_sharding commits between our shard_count read and the debit.
+            sharding.disable_sharding(wallet)
+            return debit(wallet, amount)
+
+        with mock.patch.object(sharding, 'debit', disable_then_debit):
+            response = self.buy([{'status_code': 200, 'body': {'status': '100', 'orderid': 'X1'}, 'latency_ms': 5}])
+
+        self.assertEqual(response.status_code, 200)
+        wallet.refresh_from_db()
+        self.assertFalse(wallet.is_sharded)
+        self.assertEqual(wallet.balance, Decimal('800.00'))
+        self.assertEqual(Decimal(str(response.json()['new_balance'])), Decimal('800.00'))
+
+    def test_sharded_wallet_vendor_failure_refunds(self):
+        # More than any one shard holds, so the debit consolidates first.
+        wallet = sharding.enable_sharding(Wallet.objects.get(user=self.user), 4)
+
+        response = self.buy([{'status_code': 200, 'body': {'status': '200', 'msg': 'LOW BALANCE'}, 'latency_ms': 5}], amount='300')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Decimal(str(response.json()['new_balance'])), Decimal('1000.00'))
+        self.assertEqual(wallet.total_balance, Decimal('1000.00'))
+        self.assertEqual(Transaction.objects.get().status, 'FAILED')
+
+
+@override_settings(VTU_VENDOR='transactions.services.ReplayVendor')
+class AdmissionControlTests(TestCase):
+
+    def setUp(self):
+        isolate_admission_state(self)
+        self.user = User.objects.create_user(username='script', password='x')
+        Wallet.objects.update_or_create(user=self.user, defaults={'balance': Decimal('1000.00')})
+        self.client.force_login(self.user)
+
+    def buy(self, client=None, network='GLO'):
+        return (client or self.client).post(
+            '/api/transactions/buy-airtime/',
+            {'network': network, 'phone_number': '08050000000', 'amount': '100'},
+            content_type='application/json',
+        )
+
+    @override_settings(PURCHASE_USER_RATE=0.001, PURCHASE_USER_BURST=1)
+    def test_user_over_rate_is_shed_with_retry_after(self):
+        self.buy()
+        response = self.buy()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # The shed request never reached the wallet / Transaction insert.
+        self.assertLessEqual(Transaction.objects.count(), 1)
+
+    @override_settings(PURCHASE_USER_RATE=0.001, PURCHASE_USER_BURST=2,
+                       PURCHASE_NETWORK_RATE=0.001, PURCHASE_NETWORK_BURST=10)
+    def test_user_refused_requests_do_not_spend_network_tokens(self):
+        statuses = [self.buy(network='MTN').status_code for _ in range(12)]
+        self.assertEqual(statuses.count(429), 10)
+
+        other = User.objects.create_user(username='shop', password='x')
+        Wallet.objects.update_or_create(user=other, defaults={'balance': Decimal('1000.00')})
+        other_client = Client()
+        other_client.force_login(other)
+
+        self.assertNotEqual(self.buy(other_client, network='MTN').status_code, 429)
+
+    @override_settings(VENDOR_MAX_IN_FLIGHT=0)
+    def test_vendor_concurrency_cap_sheds_with_503(self):
+        response = self.buy()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Transaction.objects.exists())
+
+
+class AirtimePurchaseValidationTests(TestCase):
+
+    def test_compiled_validation_matches_serializer(self):
+        valid = {'network': 'MTN', 'phone_number': ' 08030000000 ', 'amount': '100.5'}
+        payloads = [
+            valid,
+            {**valid, 'amount': 200},
+            {**valid, 'amount': 99.999},
+            {**valid, 'amount': '0'},
+            {**valid, 'amount': '-5'},
+            {**valid, 'amount': 'NaN'},
+            {**valid, 'amount': '1e3'},
+            {**valid, 'amount': '100000000'},
+            {**valid, 'amount': True},
+            {**valid, 'network': 'mtn'},
+            {**valid, 'network': ''},
+            {**valid, 'network': ['MTN']},
+            {**valid, 'phone_number': '   '},
+            {**valid, 'phone_number': '0' * 16},
+            {**valid, 'phone_number': '0803\x00'},
+            {**valid, 'phone_number': {'n': 1}},
+            {**valid, 'phone_number': None},
+            {'amount': '50'},
+            'not a dict',
+        ]
+        for payload in payloads:
+            serializer = AirtimePurchaseSerializer(data=payload)
+            serializer.is_valid()
+            self.assertEqual(
+                validate_airtime_purchase(payload), (serializer.validated_data, serializer.errors), payload,
+            )
+
+
+class TrafficSanitizeTests(TestCase):
+
+    def test_secrets_dropped_and_phones_masked_consistently(self):
+        clean = traffic.sanitize({
+            'pin': '1234',
+            'phone_number': '08031234567',
+            'data': {'reference': 'FUND-1', 'customer': {'email': 'a@b.c'}},
+        })
+
+        self.assertNotIn('pin', clean)
+        self.assertEqual(clean['data'], {'reference': 'FUND-1'})
+        self.assertNotEqual(clean['phone_number'], '08031234567')
+        self.assertEqual(len(clean['phone_number']), 11)
+        self.assertEqual(clean, traffic.sanitize({'phone_number': '08031234567', 'data': {'reference': 'FUND-1'}}))
+
+
+class BackgroundQueueHandlerTests(TestCase):
+
+    def setUp(self):
+        self.handler = BackgroundQueueHandler(maxsize=2)
+        self.handler.setFormatter(JsonFormatter())
+        self.handler._ensure_started()
+        # Stop the listener so nothing drains the queue.
+        self.handler.flush_and_stop()
+
+    def log(self, level, msg, *args):
+        self.handler.handle(logging.makeLogRecord({
+            'name': 'test', 'levelno': level, 'levelname': logging.getLevelName(level), 'msg': msg, 'args': args,
+        }))
+
+    def messages(self, count):
+        return [json.loads(self.handler.queue.get(timeout=5).msg)['message'] for _ in range(count)]
+
+    def test_records_are_formatted_on_the_logging_thread(self):
+        class Probe:
+            def __str__(self):
+                self.thread = threading.current_thread()
+                return 'probe'
+
+        probe = Probe()
+        self.log(logging.INFO, 'hello %s', probe)
+
+        self.assertIs(probe.thread, threading.current_thread())
+        self.assertEqual(self.messages(1), ['hello probe'])
+
+    def test_full_queue_drops_info_but_waits_for_errors(self):
+        for i in range(3):
+            self.log(logging.INFO, 'info %d', i)
+        error = threading.Thread(target=self.log, args=(logging.ERROR, 'boom'))
+        error.start()
+        error.join(0.2)
+        self.assertTrue(error.is_alive())
+
+        self.assertEqual(self.messages(2), ['info 0', 'info 1'])
+        error.join(5)
+        self.assertEqual(self.messages(1), ['boom'])
+
+        self.log(logging.INFO, 'info 3')
+        self.assertEqual(self.messages(2), ['Log queue full, dropped 1 records', 'info 3'])
+
+
+@override_settings(VENDOR_FLOAT_MAX_AGE_SECONDS=600, VENDOR_FLOAT_ALERT_THRESHOLDS=[50000, 10000])
+class VendorFloatTests(TestCase):
+
+    def setUp(self):
+        self.float = VendorFloat(f"test-float-{uuid.uuid4().hex[:8]}")
+
+    def tearDown(self):
+        if os.path.exists(self.float.region.path):
+            os.unlink(self.float.region.path)
+
+    def test_unknown_float_lets_purchases_through(self):
+        self.assertIsNone(self.float.reserve(Decimal('100')))
+        self.assertTrue(self.float.can_fill(Decimal('1000000')))
+
+    def test_reservations_and_releases_track_the_float(self):
+        self.float.sync(Decimal('60000'))
+        self.float.reserve(Decimal('59950'))
+
+        self.assertFalse(self.float.can_fill(Decimal('100')))
+        self.float.release(Decimal('59950'))
+        self.assertTrue(self.float.can_fill(Decimal('100')))
+
+    def test_alerts_once_per_threshold_crossed(self):
+        self.float.sync(Decimal('60000'))
+        with self.assertLogs('transactions.vendor_float', 'CRITICAL') as logs:
+            self.float.reserve(Decimal('15000'))
+            self.float.reserve(Decimal('1000'))
+            self.float.reserve(Decimal('40000'))
+        self.assertEqual(len(logs.records), 2)
+
+    @override_settings(VENDOR_FLOAT_MAX_AGE_SECONDS=0)
+    def test_stale_float_is_ignored(self):
+        self.float.sync(Decimal('0'))
+        self.assertTrue(self.float.can_fill(Decimal('100')))
+
+    def test_balance_is_kept_to_the_kobo(self):
+        with self.assertLogs('transactions.vendor_float', 'CRITICAL') as logs:
+            self.float.sync(Decimal('50'))
+        self.assertEqual(logs.records[0].getMessage(), "Vendor float is ₦50.00, below the ₦10000 alert threshold")
+
+        self.float.sync(Decimal('0.10'))
+        self.float.reserve(Decimal('0.07'))
+        self.assertEqual(self.float.known_balance(), Decimal('0.03'))
+
+
+class FloatTrackingVendor(ReplayVendor):
+    """ReplayVendor that keeps the (per-test) shared vendor float in step."""
+    tracks_float = True
+
+
+@override_settings(
+    VTU_VENDOR='transactions.tests.FloatTrackingVendor',
+    VENDOR_FLOAT_POLL_SECONDS=0,
+    VENDOR_FLOAT_MAX_AGE_SECONDS=600,
+    VENDOR_FLOAT_ALERT_THRESHOLDS=[],
+)
+class VendorFloatPurchaseTests(TestCase):
+
+    def setUp(self):
+        isolate_admission_state(self)
+        vendor_float.sync(Decimal('1000'))
+
+    def purchase(self, reply):
+        token = traffic.replay_vendor_calls([{'status_code': 200, 'body': reply, 'latency_ms': 0}], latency_scale=0)
+        try:
+            return FloatTrackingVendor().purchase_airtime('MTN', '08030000000', Decimal('100'), str(uuid.uuid4()))
+        finally:
+            traffic.stop_replay(token)
+
+    def test_success_keeps_the_reservation(self):
+        self.assertEqual(self.purchase({'status': '100', 'orderid': 'X1'})['status'], 'success')
+        self.assertEqual(vendor_float.known_balance(), Decimal('900'))
+
+    def test_reported_balance_resyncs(self):
+        self.purchase({'status': '100', 'orderid': 'X1', 'walletbalance': '1,234.50'})
+        self.assertEqual(vendor_float.known_balance(), Decimal('1234.50'))
+
+    def test_failure_releases_the_reservation(self):
+        self.assertEqual(self.purchase({'status': '200', 'msg': 'INVALID NUMBER'})['status'], 'failed')
+        self.assertEqual(vendor_float.known_balance(), Decimal('1000'))
+
+    def test_insufficient_float_failure_empties_it(self):
+        with self.assertLogs('transactions.services', 'ERROR'):
+            self.purchase({'status': '200', 'msg': 'INSUFFICIENT BALANCE'})
+        self.assertEqual(vendor_float.known_balance(), Decimal('0'))
+
+    def test_view_refuses_before_touching_the_wallet(self):
+        user = User.objects.create_user(username='buyer', password='x')
+        Wallet.objects.update_or_create(user=user, defaults={'balance': Decimal('1000.00')})
+        self.client.force_login(user)
+        vendor_float.sync(Decimal('50'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/transactions/buy-airtime/',
+                {'network': 'MTN', 'phone_number': '08030000000', 'amount': '100'},
+                content_type='application/json',
+            )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertFalse([q['sql'] for q in queries if 'payments_wallet' in q['sql'] or 'transactions_transaction' in q['sql']])
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(Wallet.objects.get(user=user).balance, Decimal('1000.00'))
@@ -0,0 +1,192 @@
+"""
+Admission control for buy-airtime.
+
+* Token buckets per user and per network (DRF throttles -> 429).
+* A cap on purchases in flight at the vendor (-> 503).
+
+Both answer with Retry-After and run in APIView.initial(), before the view
+body, so a shed request never locks a wallet or inserts a Transaction.
+
+State lives in small memory-mapped files under /dev/shm (core/shm.py),
+shared by every gunicorn worker on the host. A check is a hash, a lock and a few struct
+reads/writes - a few microseconds, no network round trip. Limits are per
+host: with N hosts the effective limit is N times the setting.
+"""
+import hashlib
+import os
+import struct
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+from core.shm import SharedRegion
+from core.validation import json_body
+
+
+class SharedTokenBuckets:
+    """
+    Token buckets in a fixed hash table. Two keys landing in the same slot
+    just reset each other's bucket (the check errs on the side of admitting),
+    so size the table well above the number of active keys.
+    """
+    SLOT = struct.Struct('=Qdd')  # key hash, tokens left, last refill time
+
+    def __init__(self, name, slots=8192):
+        self.slots = slots
+        self.region = SharedRegion(name, self.SLOT.size * slots)
+
+    def take(self, key, rate, burst):
+        """Take one token. Returns 0 if admitted, else seconds until one is available."""
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+        offset = (digest % self.slots) * self.SLOT.size
+        # CLOCK_MONOTONIC is system-wide, so all workers agree on it.
+        now = time.monotonic()
+
+        with self.region.locked() as buf:
+            stored, tokens, last = self.SLOT.unpack_from(buf, offset)
+            if stored != digest:
+                tokens, last = burst, now
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self.SLOT.pack_into(buf, offset, digest, tokens - 1, now)
+                return 0
+            self.SLOT.pack_into(buf, offset, digest, tokens, now)
+        return (1 - tokens) / rate
+
+
+class SharedInFlightGate:
+    """
+    Counts purchases in flight across all workers on the host.
+
+    Slot 0 holds the running total, checked on every acquire. Each process
+    also keeps its own (pid, count) slot, so when a worker dies mid-call its
+    count can be reaped instead of leaking forever.
+    """
+    SLOT = struct.Struct('=qq')  # pid, in-flight count (slot 0: unused, total)
+
+    def __init__(self, name, slots=128):
+        self.slots = slots
+        self.region = SharedRegion(name, self.SLOT.size * slots)
+        self._slot_pid = None
+        self._slot = None
+
+    def _get(self, buf, i):
+        return self.SLOT.unpack_from(buf, i * self.SLOT.size)
+
+    def _set(self, buf, i, pid, count):
+        self.SLOT.pack_into(buf, i * self.SLOT.size, pid, count)
+
+    def _own_slot(self, buf):
+        pid = os.getpid()
+        if self._slot_pid == pid and self._get(buf, self._slot)[0] == pid:
+            return self._slot
+        free = None
+        for i in range(1, self.slots):
+            slot_pid, _ = self._get(buf, i)
+            if slot_pid == pid:
+                free = i
+                break
+            if slot_pid == 0 and free is None:
+                free = i
+        if free is None:
+            raise RuntimeError("No free admission slot; raise SharedInFlightGate.slots")
+        if self._get(buf, free)[0] != pid:
+            self._set(buf, free, pid, 0)
+        self._slot_pid, self._slot = pid, free
+        return free
+
+    def _reap_dead(self, buf):
+        """Drop slots of processes that no longer exist and recount the total."""
+        total = 0
+        for i in range(1, self.slots):
+            pid, count = self._get(buf, i)
+            if not pid:
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                self._set(buf, i, 0, 0)
+                continue
+            except PermissionError:
+                pass  # alive, owned by someone else
+            total += count
+        self._set(buf, 0, 0, total)
+        return total
+
+    def acquire(self, limit):
+        with self.region.locked() as buf:
+            total = self._get(buf, 0)[1]
+            # Only pay for the reaping syscalls when we're about to refuse.
+            if total >= limit and self._reap_dead(buf) >= limit:
+                return False
+            i = self._own_slot(buf)
+            pid, count = self._get(buf, i)
+            self._set(buf, i, pid, count + 1)
+            self._set(buf, 0, 0, self._get(buf, 0)[1] + 1)
+        return True
+
+    def release(self):
+        with self.region.locked() as buf:
+            i = self._own_slot(buf)
+            pid, count = self._get(buf, i)
+            if count > 0:
+                self._set(buf, i, pid, count - 1)
+                self._set(buf, 0, 0, max(self._get(buf, 0)[1] - 1, 0))
+
+
+buckets = SharedTokenBuckets('buckets')
+vendor_gate = SharedInFlightGate('vendor-in-flight')
+
+
+class _BucketThrottle(BaseThrottle):
+    rate_setting = None
+    burst_setting = None
+
+    def get_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        key = self.get_key(request)
+        if key is None:
+            return True
+        self._wait = buckets.take(
+            key, getattr(settings, self.rate_setting), getattr(settings, self.burst_setting),
+        )
+        return self._wait == 0
+
+    def wait(self):
+        return self._wait
+
+
+class UserPurchaseThrottle(_BucketThrottle):
+    """Stops one reseller script from hogging the workers."""
+    rate_setting = 'PURCHASE_USER_RATE'
+    burst_setting = 'PURCHASE_USER_BURST'
+
+    def get_key(self, request):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return f"user:{request.user.pk}"
+
+
+class NetworkPurchaseThrottle(_BucketThrottle):
+    """Keeps us under the vendor's rate limit for each network."""
+    rate_setting = 'PURCHASE_NETWORK_RATE'
+    burst_setting = 'PURCHASE_NETWORK_BURST'
+
+    def get_key(self, request):
+        data = json_body(request)
+        network = data.get('network') if hasattr(data, 'get') else None
+        if not isinstance(network, str) or not network:
+            return None  # The serializer will reject it.
+        return f"network:{network.upper()}"
+
+
+class VendorBusy(APIException):
+    status_code = 503
+    default_detail = "Too many purchases in progress, please retry shortly."
+    default_code = 'vendor_busy'
+    # DRF's exception handler turns this into a Retry-After header.
+    wait = 1
@@ -0,0 +1,175 @@
+"""
+Cached view of our prepaid balance ("float") with the VTU vendor.
+
+When the float runs out every purchase still locks a wallet, debits it,
+calls the vendor and refunds on its failure. To avoid that, we keep the
+float in shared memory (one copy per host, like throttling.py):
+
+* a background thread in each worker polls the vendor's balance endpoint.
+  The workers coordinate through the shared state, so the host polls once
+  per VENDOR_FLOAT_POLL_SECONDS, not once per worker;
+* every purchase sent to the vendor decrements it optimistically, and a
+  failed purchase gives the amount back;
+* any vendor reply that reports a balance resyncs it, and an "insufficient
+  balance" failure marks it empty until the next poll;
+* BuyAirtimeView rejects a purchase up front when the float can't cover it;
+* crossing below a VENDOR_FLOAT_ALERT_THRESHOLDS level logs an alert once.
+
+If the float is unknown or stale (older than VENDOR_FLOAT_MAX_AGE_SECONDS)
+purchases are let through - the vendor itself is the final word.
+"""
+import logging
+import os
+import struct
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from core.shm import SharedRegion
+
+logger = logging.getLogger(__name__)
+
+# Vendor failure messages that mean our float is exhausted.
+INSUFFICIENT_MARKERS = ('insufficient', 'low balance', 'low wallet')
+# Keys under which vendor replies report our remaining balance.
+BALANCE_KEYS = ('walletbalance', 'wallet_balance', 'balance')
+
+
+def parse_balance(raw):
+    """Find our remaining balance in a vendor reply, if it reports one."""
+    if not isinstance(raw, dict):
+        return None
+    for key, value in raw.items():
+        if str(key).lower() in BALANCE_KEYS and value not in (None, ''):
+            try:
+                return Decimal(str(value).replace(',', ''))
+            except InvalidOperation:
+                return None
+    return None
+
+
+def reports_insufficient_float(raw, message):
+    text = f"{raw.get('msg', '') if isinstance(raw, dict) else ''} {message or ''}".lower()
+    return any(marker in text for marker in INSUFFICIENT_MARKERS)
+
+
+def _to_kobo(naira):
+    return int((Decimal(naira) * 100).to_integral_value())
+
+
+def _from_kobo(kobo):
+    return Decimal(kobo).scaleb(-2)
+
+
+class VendorFloat:
+    # Balance in kobo (exact, unlike a double), synced at, next poll at, alert level.
+    STATE = struct.Struct('=qddq')
+
+    def __init__(self, name='vendor-float'):
+        self.region = SharedRegion(name, self.STATE.size)
+
+    def _thresholds(self):
+        return sorted((Decimal(str(t)) for t in settings.VENDOR_FLOAT_ALERT_THRESHOLDS), reverse=True)
+
+    def _update(self, change, resync=False):
+        """
+        Apply ``change(balance) -> new balance`` under the lock, alerting on
+        threshold crossings. Optimistic changes only apply to a known, fresh
+        float; ``resync`` sets it regardless. Returns the new balance or None.
+        """
+        now = time.time()
+        alert = None
+        with self.region.locked() as buf:
+            balance, synced_at, next_poll, alerted = self.STATE.unpack_from(buf, 0)
+            fresh = bool(synced_at) and now - synced_at <= settings.VENDOR_FLOAT_MAX_AGE_SECONDS
+            if not (fresh or resync):
+                return None
+            kobo = _to_kobo(change(_from_kobo(balance)))
+            balance = _from_kobo(kobo)
+            if resync:
+                synced_at = now
+            thresholds = self._thresholds()
+            level = sum(1 for t in thresholds if balance < t)
+            if level > alerted:
+                alert = thresholds[level - 1]
+            self.STATE.pack_into(buf, 0, kobo, synced_at, next_poll, level)
+        if alert is not None:
+            logger.critical("Vendor float is ₦%s, below the ₦%s alert threshold", balance, alert)
+        return balance
+
+    def known_balance(self):
+        with self.region.locked() as buf:
+            balance, synced_at, _, _ = self.STATE.unpack_from(buf, 0)
+        if not synced_at or time.time() - synced_at > settings.VENDOR_FLOAT_MAX_AGE_SECONDS:
+            return None
+        return _from_kobo(balance)
+
+    def can_fill(self, amount):
+        balance = self.known_balance()
+        return balance is None or balance >= amount
+
+    def reserve(self, amount):
+        """A purchase is going out: take its amount off the cached float."""
+        return self._update(lambda balance: balance - amount)
+
+    def release(self, amount):
+        """A reserved purchase failed: give the amount back."""
+        return self._update(lambda balance: balance + amount)
+
+    def sync(self, balance):
+        """The vendor told us the real balance."""
+        return self._update(lambda _: Decimal(balance), resync=True)
+
+    def claim_poll(self, interval):
+        """True for exactly one caller per ``interval`` across the host."""
+        now = time.time()
+        with self.region.locked() as buf:
+            balance, synced_at, next_poll, alerted = self.STATE.unpack_from(buf, 0)
+            if now < next_poll:
+                return False
+            self.STATE.pack_into(buf, 0, balance, synced_at, now + interval, alerted)
+        return True
+
+
+vendor_float = VendorFloat()
+
+_poller_pid = None
+_poller_lock = threading.Lock()
+
+
+def poll_once():
+    try:
+        balance = import_string(settings.VTU_VENDOR)().get_balance()
+    except Exception as e:
+        logger.warning("Vendor float poll failed: %s", e)
+        return None
+    if balance is not None:
+        vendor_float.sync(balance)
+    return balance
+
+
+def _poll_loop():
+    interval = settings.VENDOR_FLOAT_POLL_SECONDS
+    while True:
+        if vendor_float.claim_poll(interval):
+            poll_once()
+        time.sleep(min(interval, 5))
+
+
+def ensure_poller():
+    """
+    Start this process's poller thread if it isn't running. Called from the
+    request path (a pid comparison when already running): a thread started
+    at import time would not survive gunicorn forking a preloaded master.
+    """
+    global _poller_pid
+    if _poller_pid == os.getpid() or settings.VENDOR_FLOAT_POLL_SECONDS <= 0:
+        return
+    with _poller_lock:
+        if _poller_pid == os.getpid():
+            return
+        threading.Thread(target=_poll_loop, name='vendor-float-poller', daemon=True).start()
+        _poller_pid = os.getpid()
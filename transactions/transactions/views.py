@@ -3,46 +3,109 @@ from rest_framework.views import APIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
 from django.db import transaction
+from django.utils.module_loading import import_string
+import logging
+
+from core import log
+from core.validation import json_body
 from payments.models import Wallet
+from payments import sharding
 from .models import Transaction
-from .serializers import AirtimePurchaseSerializer
-# Import our new mock vendor service
-from .services import RealVTUVendor
+from .serializers import validate_airtime_purchase
+from .throttling import UserPurchaseThrottle, NetworkPurchaseThrottle, VendorBusy, vendor_gate
+from . import vendor_float
+logger = logging.getLogger(__name__)
 
 class BuyAirtimeView(APIView):
     permission_classes = [IsAuthenticated]
+    # Shed load (429 + Retry-After) before any wallet lock or Transaction insert.
+    throttle_classes = [UserPurchaseThrottle, NetworkPurchaseThrottle]
+
+    def check_throttles(self, request):
+        # Stop at the first refusal (DRF asks every throttle), so a request
+        # the user bucket turns away never spends a network token.
+        for throttle in self.get_throttles():
+            if not throttle.allow_request(request, self):
+                self.throttled(request, throttle.wait())
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Runs after auth and throttles: cap purchases in flight at the vendor (503).
+        if request.method == 'POST':
+            if not vendor_gate.acquire(settings.VENDOR_MAX_IN_FLIGHT):
+                raise VendorBusy()
+            request.holds_vendor_slot = True
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(request, 'holds_vendor_slot', False):
+            request.holds_vendor_slot = False
+            vendor_gate.release()
+        return super().finalize_response(request, response, *args, **kwargs)
 
     def post(self, request):
-        # 1. Validate data
-        serializer = AirtimePurchaseSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=400)
-
-        amount = serializer.validated_data['amount']
-        network = serializer.validated_data['network']
-        phone_number = serializer.validated_data['phone_number']
+        # 1. Validate data (same rules as AirtimePurchaseSerializer, compiled)
+        data, errors = validate_airtime_purchase(json_body(request))
+        if errors:
+            return Response(errors, status=400)
+
+        amount = data['amount']
+        network = data['network']
+        phone_number = data['phone_number']
         user = request.user
 
-        # Initialize vendor
-        vendor = RealVTUVendor()
+        # Initialize vendor (settings.VTU_VENDOR, normally services.RealVTUVendor)
+        vendor = import_string(settings.VTU_VENDOR)()
+
+        # Reject what the vendor can't fill right now, before touching the wallet.
+        if vendor.tracks_float:
+            vendor_float.ensure_poller()
+            if not vendor_float.vendor_float.can_fill(amount):
+                return Response(
+                    {"error": "Airtime is temporarily unavailable. Please try again later."},
+                    status=503,
+                    headers={'Retry-After': str(settings.VENDOR_FLOAT_POLL_SECONDS)},
+                )
 
         try:
             # === DATABASE TRANSACTION START ===
             # We wrap everything to ensure money isn't lost if code crashes halfway
             with transaction.atomic():
+                shard = None
                 # a. Lock & Get Wallet
-                wallet = Wallet.objects.select_for_update().get(user=user)
+                wallet = Wallet.objects.select_for_update().filter(user=user, shard_count=0).first()
+                if wallet is None:
+                    # Sharded wallet: never lock the wallet row itself, only
+                    # the one sub-balance we take the money from.
+                    # (Raises DoesNotExist if there is no wallet at all.)
+                    sharded_wallet = Wallet.objects.get(user=user)
+                    try:
+                        # b/c. Check Balance & Deduct Money from one shard (Temporarily)
+                        shard = sharding.debit(sharded_wallet, amount)
+                    except sharding.InsufficientFunds:
+                        # shard_count was read without a lock: disable_sharding
+                        # may have folded the shards back in since. If so, pay
+                        # from the plain balance below.
+                        wallet = Wallet.objects.select_for_update().filter(user=user, shard_count=0).first()
+                        if wallet is None:
+                            return Response({"error": "Insufficient funds"}, status=400)
 
-                # b. Check Balance
-                if wallet.balance < amount:
-                    return Response({"error": "Insufficient funds"}, status=400)
+                if shard is not None:
+                    # Summed after the debit, with our shard locked: the shards
+                    # can't be folded away until we commit.
+                    new_balance = sharded_wallet.total_balance
+                    old_balance = new_balance + amount
+                else:
+                    # b. Check Balance
+                    if wallet.balance < amount:
+                        return Response({"error": "Insufficient funds"}, status=400)
 
-                # c. Deduct Money (Temporarily)
-                old_balance = wallet.balance
-                new_balance = wallet.balance - amount
-                wallet.balance = new_balance
-                wallet.save()
+                    # c. Deduct Money (Temporarily)
+                    old_balance = wallet.balance
+                    new_balance = wallet.balance - amount
+                    wallet.balance = new_balance
+                    wallet.save()
 
                 # d. Create PENDING Transaction Record
                 trx = Transaction.objects.create(
@@ -56,6 +119,7 @@ class BuyAirtimeView(APIView):
                     status='PENDING',
                     description=f"Airtime purchase of ₦{amount} for {phone_number}"
                 )
+                log.bind(transaction_id=trx.transaction_id)
                
                 # === CALL VENDOR API (The dangerous part) ===
                 # Note: In production, this should often be done outside the atomic block via Celery tasks.
@@ -74,14 +138,17 @@ class BuyAirtimeView(APIView):
                         "status": "success",
                         "message": "Airtime delivered successfully",
                         "transaction_id": trx.transaction_id,
-                        "new_balance": wallet.balance
+                        "new_balance": new_balance
                     }
                     status_code = 200
 
                 else:
                     # VENDOR FAILED - REFUND THE USER!
-                    wallet.balance = old_balance # Give money back
-                    wallet.save()
+                    if shard is not None:
+                        sharding.refund(shard, amount)
+                    else:
+                        wallet.balance = old_balance # Give money back
+                        wallet.save()
                    
                     trx.status = 'FAILED'
                     trx.description = f"Failed: {vendor_response['message']}"
@@ -94,7 +161,7 @@ class BuyAirtimeView(APIView):
                         "status": "failed",
                         "message": vendor_response['message'],
                         "transaction_id": trx.transaction_id,
-                        "new_balance": wallet.balance # Balance is restored
+                        "new_balance": old_balance # Balance is restored
                     }
                     status_code = 400 # Or 503 depending on preference
 
@@ -105,5 +172,5 @@ class BuyAirtimeView(APIView):
             return Response({"error": "User has no wallet"}, status=400)
         except Exception as e:
             # Unexpected crash - transaction block will auto-rollback changes
-            print(f"Critical Error: {str(e)}")
+            logger.exception("Critical Error: %s", e)
             return Response({"error": "An unexpected error occurred"}, status=500)
\ No newline at end of file